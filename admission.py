@@ -0,0 +1,57 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Admission control for expensive queries. Callers estimate a query's cost up front
+# (rows scanned plus points sent to the browser). Cheap queries run straight away;
+# expensive ones need one of a few slots and wait for it in a bounded queue. When the
+# queue is full or the wait times out the query is not admitted, and the caller serves a
+# coarser answer or sheds it, so a burst of full-year queries cannot hold every worker
+# and push everyone else's latency up without bound. Limits apply per server process.
+
+CHEAP_QUERY_COST = int(os.environ.get('DASHBOARD_CHEAP_QUERY_COST', 250000))
+EXPENSIVE_QUERY_SLOTS = int(os.environ.get('DASHBOARD_EXPENSIVE_SLOTS', 2))
+MAX_QUEUED_QUERIES = int(os.environ.get('DASHBOARD_MAX_QUEUED', 4))
+QUEUE_TIMEOUT = float(os.environ.get('DASHBOARD_QUEUE_TIMEOUT', 2.0))
+
+expensive_slots = threading.BoundedSemaphore(EXPENSIVE_QUERY_SLOTS)
+stats_lock = threading.Lock()
+# Totals per outcome, plus how many expensive queries are waiting and running right now
+admission_stats = {'cheap': 0, 'admitted': 0, 'rejected': 0, 'waiting': 0, 'running': 0}
+
+
+def count(name, change=1):
+    with stats_lock:
+        admission_stats[name] += change
+
+
+@contextmanager
+def admission(cost):
+    # Yields True when the query may run in full, False when it should degrade or be shed
+    if cost < CHEAP_QUERY_COST:
+        count('cheap')
+        yield True
+        return
+
+    with stats_lock:
+        queue_full = admission_stats['waiting'] >= MAX_QUEUED_QUERIES
+        if not queue_full:
+            admission_stats['waiting'] += 1
+
+    acquired = False
+    if not queue_full:
+        acquired = expensive_slots.acquire(timeout=QUEUE_TIMEOUT)
+        count('waiting', -1)
+
+    if not acquired:
+        count('rejected')
+        yield False
+        return
+
+    count('admitted')
+    count('running')
+    try:
+        yield True
+    finally:
+        count('running', -1)
+        expensive_slots.release()
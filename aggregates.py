@@ -0,0 +1,258 @@
+import os
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Day-level aggregates behind the dashboard views. main_df is sorted by date, so it is
+# cut at day boundaries into a few contiguous row ranges per worker; every aggregate key
+# includes the day, so no key is split between two ranges. The columns the aggregates
+# read are encoded once into compact arrays (airports and airlines as integer codes) in
+# shared memory; worker processes attach to it and are only sent a row range, not a
+# pickled copy of its rows. Partial results are merged in key order, so the output does
+# not depend on the number of workers or which one finishes first. This module has no
+# import-time side effects so pool workers can import it cheaply.
+
+AGGREGATE_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', os.cpu_count() or 1))
+# Row ranges per worker; more than one evens out ranges that take longer than others.
+# Ranges below MIN_RANGE_ROWS cost more in per-range overhead than they save.
+RANGES_PER_WORKER = 4
+MIN_RANGE_ROWS = 50000
+# The pool is started from the background loading thread, and forking a process that has
+# other threads running can leave a lock held forever in the child. Workers are started
+# from a clean server process (or spawned) instead.
+POOL_START_METHOD = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                     else 'spawn')
+
+AIRPORT_MEASURES = ['TAXI_IN', 'TAXI_OUT', 'AIR_SYSTEM_DELAY', 'SECURITY_DELAY',
+                    'AIRLINE_DELAY', 'LATE_AIRCRAFT_DELAY', 'WEATHER_DELAY',
+                    'ARRIVAL_DELAY', 'DEPARTURE_DELAY']
+AIRLINE_MEASURES = ['TOTAL_DELAY', 'CANCELLED', 'DIVERTED']
+# Delay and taxi-out sums only cover flights that departed, counted by 'departed'
+HOURLY_MEASURES = ['flights', 'departed', 'DEPARTURE_DELAY', 'TAXI_OUT', 'CANCELLED']
+
+AGGREGATE_KEYS = {
+    'airport_daily': ['ORIGIN_AIRPORT', 'Date'],
+    'route_daily': ['ORIGIN_AIRPORT', 'DESTINATION_AIRPORT', 'Date'],
+    'airline_daily': ['AIRLINE_NAME', 'Date'],
+    # Sparse airport x day x scheduled-hour cube: only combinations with flights get a row
+    'airport_hourly': ['ORIGIN_AIRPORT', 'Date', 'HOUR']
+}
+# Key columns stored as integer codes, and which label table decodes them
+CODED_KEYS = {'ORIGIN_AIRPORT': 'airports', 'DESTINATION_AIRPORT': 'airports', 'AIRLINE_NAME': 'airlines'}
+# Delays and taxi times are whole minutes, which float32 holds exactly; the flags are 0/1
+MEASURE_COLUMNS = AIRPORT_MEASURES
+FLAG_COLUMNS = ['CANCELLED', 'DIVERTED']
+
+# Set in each worker process by attach_shared_columns
+shared_blocks = []
+shared_columns = {}
+
+
+def encode_columns(main_df):
+    # Compact arrays of the columns the aggregates read, plus the labels behind the codes
+    rows = len(main_df)
+    airport_codes, airports = pd.factorize(
+        pd.concat([main_df['ORIGIN_AIRPORT'], main_df['DESTINATION_AIRPORT']], ignore_index=True))
+    airline_codes, airlines = pd.factorize(main_df['AIRLINE_NAME'])
+
+    columns = {
+        'ORIGIN_AIRPORT': airport_codes[:rows].astype(np.int32),
+        'DESTINATION_AIRPORT': airport_codes[rows:].astype(np.int32),
+        'AIRLINE_NAME': airline_codes.astype(np.int32),
+        'Date': main_df['Date'].to_numpy().astype('datetime64[D]').astype(np.int32),
+        'SCHEDULED_DEPARTURE': main_df['SCHEDULED_DEPARTURE'].to_numpy().astype(np.int16)
+    }
+    for column in MEASURE_COLUMNS:
+        columns[column] = main_df[column].to_numpy().astype(np.float32)
+    for column in FLAG_COLUMNS:
+        columns[column] = main_df[column].to_numpy().astype(np.int8)
+    labels = {'airports': np.asarray(airports, dtype=object), 'airlines': np.asarray(airlines, dtype=object)}
+    return columns, labels
+
+
+def day_ranges(days, count):
+    # Up to count [first, stop) row ranges of about equal size, each ending on a day
+    # boundary; days are the encoded dates of main_df, which must be sorted by date
+    if np.any(np.diff(days) < 0):
+        raise ValueError("main_df must be sorted by date")
+    day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    targets = np.linspace(0, len(days), count + 1)[1:-1]
+    cuts = np.unique(day_starts[np.minimum(np.searchsorted(day_starts, targets), len(day_starts) - 1)])
+    bounds = np.r_[0, cuts[cuts > 0], len(days)]
+    return [(int(first), int(stop)) for first, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def share_columns(columns):
+    blocks, specs = [], {}
+    for column, values in columns.items():
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        blocks.append(block)
+        specs[column] = (block.name, values.dtype.str, len(values))
+    return blocks, specs
+
+
+def attach_shared_columns(specs):
+    # Pool initializer: map the parent's shared arrays without copying them
+    for column, (name, dtype, length) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        shared_blocks.append(block)
+        shared_columns[column] = np.ndarray(length, dtype=dtype, buffer=block.buf)
+
+
+def build_range_aggregates(first, stop, columns=None):
+    # Aggregates of rows [first, stop), whole days, from the shared arrays in a worker
+    columns = shared_columns if columns is None else columns
+    range_df = pd.DataFrame({column: values[first:stop] for column, values in columns.items()})
+    # Sums are taken at the input's full width, as before encoding
+    range_df[MEASURE_COLUMNS] = range_df[MEASURE_COLUMNS].astype(np.float64)
+    range_df[FLAG_COLUMNS] = range_df[FLAG_COLUMNS].astype(np.int64)
+
+    airport_daily = range_df.groupby(AGGREGATE_KEYS['airport_daily'])[AIRPORT_MEASURES].sum()
+    airport_daily.insert(0, 'flights', range_df.groupby(AGGREGATE_KEYS['airport_daily']).size())
+
+    route_daily = range_df.groupby(AGGREGATE_KEYS['route_daily']).size().rename('flights').to_frame()
+
+    airline_df = range_df.assign(TOTAL_DELAY=range_df['DEPARTURE_DELAY'] + range_df['ARRIVAL_DELAY'])
+    airline_daily = airline_df.groupby(AGGREGATE_KEYS['airline_daily'])[AIRLINE_MEASURES].sum()
+    airline_daily.insert(0, 'flights', airline_df.groupby(AGGREGATE_KEYS['airline_daily']).size())
+
+    # SCHEDULED_DEPARTURE is HHMM; 2400 means midnight
+    departed = 1 - range_df['CANCELLED']
+    hourly_df = pd.DataFrame({
+        'ORIGIN_AIRPORT': range_df['ORIGIN_AIRPORT'],
+        'Date': range_df['Date'],
+        'HOUR': (range_df['SCHEDULED_DEPARTURE'] // 100 % 24).astype(np.int8),
+        'flights': 1,
+        'departed': departed,
+        'DEPARTURE_DELAY': range_df['DEPARTURE_DELAY'] * departed,
+        'TAXI_OUT': range_df['TAXI_OUT'] * departed,
+        'CANCELLED': range_df['CANCELLED']
+    })
+    airport_hourly = hourly_df.groupby(AGGREGATE_KEYS['airport_hourly'])[HOURLY_MEASURES].sum()
+
+    return {
+        'airport_daily': airport_daily.reset_index(),
+        'route_daily': route_daily.reset_index(),
+        'airline_daily': airline_daily.reset_index(),
+        'airport_hourly': airport_hourly.reset_index()
+    }
+
+
+def decode_keys(frame, labels):
+    for column, label_table in CODED_KEYS.items():
+        if column in frame:
+            frame[column] = labels[label_table][frame[column].to_numpy()]
+    frame['Date'] = frame['Date'].to_numpy().astype('datetime64[D]').astype('datetime64[ns]')
+    return frame
+
+
+def merge_aggregates(partials, labels):
+    # partials: {first row of the range: result of build_range_aggregates}
+    merged = {}
+    for name, keys in AGGREGATE_KEYS.items():
+        frames = [partials[first][name] for first in sorted(partials)]
+        merged[name] = (decode_keys(pd.concat(frames, ignore_index=True), labels)
+                        .sort_values(keys, kind='stable')
+                        .reset_index(drop=True))
+    return merged
+
+
+def build_day_aggregates(main_df, workers=None):
+    workers = workers or AGGREGATE_WORKERS
+    started = time.time()
+    columns, labels = encode_columns(main_df)
+    ranges = day_ranges(columns['Date'], max(1, min(workers * RANGES_PER_WORKER, len(main_df) // MIN_RANGE_ROWS)))
+
+    partials = {}
+    if workers == 1:
+        for done, (first, stop) in enumerate(ranges, start=1):
+            partials[first] = build_range_aggregates(first, stop, columns)
+            report_progress(done, len(ranges), started)
+        return merge_aggregates(partials, labels)
+
+    if multiprocessing.current_process().name != 'MainProcess':
+        # A pool worker re-running a caller's unguarded __main__ got here. Fail before
+        # sharing anything: the parent sees its pool break and finishes in-process
+        raise RuntimeError("build_day_aggregates cannot start a worker pool from a worker process")
+
+    blocks, specs = share_columns(columns)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                                 mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                                 initializer=attach_shared_columns, initargs=(specs,)) as pool:
+            futures = {pool.submit(build_range_aggregates, first, stop): first for first, stop in ranges}
+            for done, future in enumerate(as_completed(futures), start=1):
+                partials[futures[future]] = future.result()
+                report_progress(done, len(ranges), started)
+    except BrokenProcessPool:
+        # A worker died: killed for memory, or it failed while re-importing a caller's
+        # __main__ that is not guarded. The ranges it did not finish are built in-process.
+        print("Aggregates: worker pool broke, finishing in-process", flush=True)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    remaining = [(first, stop) for first, stop in ranges if first not in partials]
+    for done, (first, stop) in enumerate(remaining, start=len(ranges) - len(remaining) + 1):
+        partials[first] = build_range_aggregates(first, stop, columns)
+        report_progress(done, len(ranges), started)
+
+    return merge_aggregates(partials, labels)
+
+
+def report_progress(done, total, started):
+    print(f"Aggregates: {done}/{total} row ranges done ({time.time() - started:.1f}s)", flush=True)
+
+
+def build_traffic_grid(route_daily, airport_df, grid_degrees):
+    # Flights in and out of every airport binned into grid_degrees cells per day, stored
+    # as prefix sums over days so the counts for any date range are one subtraction.
+    traffic = pd.concat([
+        route_daily[['ORIGIN_AIRPORT', 'Date', 'flights']].rename(columns={'ORIGIN_AIRPORT': 'AIRPORT'}),
+        route_daily[['DESTINATION_AIRPORT', 'Date', 'flights']].rename(columns={'DESTINATION_AIRPORT': 'AIRPORT'})
+    ])
+    traffic = traffic.merge(airport_df[['IATA_CODE', 'LATITUDE', 'LONGITUDE']],
+                            left_on='AIRPORT', right_on='IATA_CODE', how='inner')
+    traffic = traffic.dropna(subset=['LATITUDE', 'LONGITUDE'])
+
+    rows = np.floor(traffic['LATITUDE'].to_numpy() / grid_degrees).astype(np.int64)
+    cols = np.floor(traffic['LONGITUDE'].to_numpy() / grid_degrees).astype(np.int64)
+    # Cells packed into one integer id each; 1-D unique is far faster than unique over row pairs
+    # and keeps the same (row, col) order
+    width = cols.max() - cols.min() + 1
+    cell_ids, cell_codes = np.unique((rows - rows.min()) * width + cols - cols.min(), return_inverse=True)
+    cell_keys = np.stack([cell_ids // width + rows.min(), cell_ids % width + cols.min()], axis=1)
+
+    dates = pd.date_range(route_daily['Date'].min(), route_daily['Date'].max(), freq='D')
+    day_codes = (traffic['Date'].to_numpy() - dates[0].to_datetime64()) // np.timedelta64(1, 'D')
+
+    counts = np.zeros((len(dates) + 1, len(cell_keys)), dtype=np.int64)
+    np.add.at(counts, (day_codes + 1, cell_codes.ravel()), traffic['flights'].to_numpy())
+
+    cells = pd.DataFrame({
+        'LATITUDE': (cell_keys[:, 0] + 0.5) * grid_degrees,
+        'LONGITUDE': (cell_keys[:, 1] + 0.5) * grid_degrees
+    })
+    return {'dates': dates, 'cells': cells, 'prefix': np.cumsum(counts, axis=0)}
+
+
+def build_route_months(route_daily, routes):
+    # Coarse level of route_daily: flights per route and calendar month, stored as prefix
+    # sums over months so any whole-month range is one subtraction. routes is the
+    # (ORIGIN_AIRPORT, DESTINATION_AIRPORT) MultiIndex giving each route its column.
+    dates = route_daily['Date']
+    months = pd.date_range(dates.min().replace(day=1), dates.max(), freq='MS')
+    month_codes = ((dates.dt.year - months[0].year) * 12 + dates.dt.month - months[0].month).to_numpy()
+    route_codes = routes.get_indexer(
+        pd.MultiIndex.from_frame(route_daily[['ORIGIN_AIRPORT', 'DESTINATION_AIRPORT']]))
+
+    counts = np.zeros((len(months) + 1, len(routes)), dtype=np.int64)
+    np.add.at(counts, (month_codes + 1, route_codes), route_daily['flights'].to_numpy())
+    return {'months': months, 'routes': routes, 'prefix': np.cumsum(counts, axis=0)}
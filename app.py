@@ -1,11 +1,20 @@
+import os
+import threading
+
 import dash
-from dash import dcc, html, Input, Output
+from dash import Patch, ctx, dcc, html, no_update, Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import Response, abort, jsonify, request
+from werkzeug.exceptions import ServiceUnavailable
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 
-import keplergl
-from keplergl import KeplerGl
+from admission import QUEUE_TIMEOUT, admission, admission_stats
+from aggregates import AGGREGATE_WORKERS
+import flight_queries as fq
+from route_geometry import arc_points_for_scale, route_polylines
 
 # # BETTER
 
@@ -58,172 +67,271 @@ from keplergl import KeplerGl
 
 
 
-def load_and_preprocess_data():
-    # Load main data
-    main_df = pd.read_csv('flights.csv', low_memory=False)
-    airport_df = pd.read_csv("airports.csv")
-    airline_df = pd.read_csv("airlines.csv").iloc[:, :2].rename(columns={
-        'IATA_CODE': 'AIRLINE_CODE', 
-        'AIRLINE': 'AIRLINE_NAME'
-    })
+# Serialize figures and patches with orjson when it is installed
+try:
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = 'orjson'
+except ImportError:
+    pass
+
+# Startup: the server listens right away while flights.csv is loaded in a background
+# thread. Until then the layout is built from lightweight dataset metadata and the
+# charts show a loading state. DASHBOARD_BACKGROUND_LOAD=0 loads before serving instead.
+BACKGROUND_LOAD = os.environ.get('DASHBOARD_BACKGROUND_LOAD', '1') != '0'
 
-    # Add a date column for filtering
-    main_df['Date'] = pd.to_datetime(main_df[['YEAR', 'MONTH', 'DAY']])
-    main_df = main_df.sort_values(by=['Date'])
+# Progressive rendering: while the day aggregates are being built (cold start only), wide
+# airport queries first render an approximate figure from the stratified sample, then the
+# exact one
+PROGRESSIVE_MIN_ROWS = 20000
 
-    # Merge airlines to include full airline names
-    main_df = main_df.merge(airline_df, left_on='AIRLINE', right_on='AIRLINE_CODE', how='left')
 
-    # Merge with airport data for additional details if needed
-    origin_df = airport_df.rename(columns={
-        'IATA_CODE': 'ORIGIN_IATA_CODE',
-        'LATITUDE': 'origin_lat',
-        'LONGITUDE': 'origin_long',
-        'STATE': 'origin_state'
-    })[['ORIGIN_IATA_CODE', 'origin_lat', 'origin_long', 'origin_state']]
+def start_loading():
+    # Aggregate pool workers re-import this module as __mp_main__ when it is run as a
+    # script; they must not load data
+    if __name__ == '__mp_main__':
+        return
+    if BACKGROUND_LOAD:
+        threading.Thread(target=fq.load, args=(AGGREGATE_WORKERS,), name='load-data', daemon=True).start()
+    else:
+        fq.load(AGGREGATE_WORKERS)
 
-    main_df = main_df.merge(origin_df, left_on='ORIGIN_AIRPORT', right_on='ORIGIN_IATA_CODE', how='left')
 
-    # Replace NaN with 0 or empty strings to prevent issues
-    main_df.fillna({'AIRLINE_NAME': 'Unknown Airline'}, inplace=True)
-    main_df.fillna(0, inplace=True)
+start_loading()
 
-    return main_df, airport_df, airline_df
 
+def coarse_note(start_date, end_date):
+    first, stop = fq.covering_months(start_date, end_date)
+    months = fq.route_months['months'][first:stop]
+    if months.empty:
+        return " (approx., server busy)"
+    return f" (approx.: whole months {months[0]:%b %Y} – {months[-1]:%b %Y}, server busy)"
 
-main_df, airport_df, airline_df = load_and_preprocess_data()
 
-# Get the unique states and airports for dropdowns
-states = main_df['origin_state'].unique()
-airports_by_state = main_df.groupby('origin_state')['ORIGIN_AIRPORT'].unique().to_dict()
-airport_coords = main_df[['ORIGIN_AIRPORT', 'origin_lat', 'origin_long']].drop_duplicates()
+HEATMAP_METRICS = {
+    'avg_departure_delay': 'Mean Departure Delay (min)',
+    'avg_taxi_out': 'Mean Taxi-Out (min)',
+    'cancellation_rate': 'Cancellation Rate'
+}
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
 # Initialize Dash app
 app = dash.Dash(__name__)
 app.title = "Flight Dashboard"
 
-app.layout = html.Div([
-    dcc.Tabs([
-        dcc.Tab(label='Airport Staff', children=[
-            # Global time slicer
-            html.Div([
-                dcc.DatePickerRange(
-                    id='time-slicer',
-                    start_date=main_df['Date'].min(),
-                    end_date=main_df['Date'].max(),
-                    display_format='YYYY-MM-DD',
-                    style={'marginBottom': '20px'}
-                )
+def load_state():
+    # True once loaded, 'failed' if the load raised, False while it is still running
+    if fq.data_ready.is_set():
+        return True
+    return 'failed' if fq.load_status['error'] else False
+
+
+# Built per page load so date bounds and states reflect the data once it is loaded
+def serve_layout():
+    metadata = fq.current_metadata()
+    return html.Div([
+        # Set to True once the background load has finished ('failed' if it failed), which
+        # re-runs the charts; polling stops either way
+        dcc.Store(id='data-ready', data=load_state()),
+        dcc.Interval(id='data-ready-poll', interval=1000, disabled=load_state() is not False),
+        dcc.Tabs([
+            dcc.Tab(label='Airport Staff', children=[
+                # Global time slicer
+                html.Div([
+                    dcc.DatePickerRange(
+                        id='time-slicer',
+                        start_date=metadata['start_date'],
+                        end_date=metadata['end_date'],
+                        display_format='YYYY-MM-DD',
+                        style={'marginBottom': '20px'}
+                    )
+                ]),
+                html.Div([
+                    html.Div([
+                        # Dropdowns for state and airport
+                        html.Label("Select State:"),
+                        dcc.Dropdown(
+                            id='state-dropdown',
+                            options=[{'label': state, 'value': state} for state in metadata['airports_by_state']],
+                            placeholder="Select a state"
+                        ),
+                        html.Label("Select Airport:"),
+                        dcc.Dropdown(
+                            id='airport-dropdown',
+                            placeholder="Select an airport"
+                        )
+                    ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'}),
+                    html.Div([
+                        # Map placeholder
+                        dcc.Graph(id='airport-map')
+                    ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'})
+                ]),
+                html.Div([
+                    # Line chart for taxi delays
+                    dcc.Graph(id='taxi-delay-line-chart'),
+                    # Set when an approximate figure was shown and the exact one is pending
+                    dcc.Store(id='airport-charts-exact-request'),
+                    # Airport the charts on screen were drawn for, None while they show a placeholder
+                    dcc.Store(id='airport-charts-drawn')
+                ], style={'width': '100%', 'marginTop': '20px'}),
+                html.Div([
+                    # Two pie charts
+                    html.Div([
+                        dcc.Graph(id='delay-distribution-pie-chart'),
+                    ], style={'width': '48%', 'display': 'inline-block'}),
+                    html.Div([
+                        dcc.Graph(id='time-split-pie-chart'),
+                    ], style={'width': '48%', 'display': 'inline-block'})
+                ], style={'marginTop': '20px'}),
+                html.Div([
+                    # Map for top connected airports
+                    html.Label("Select Flight Direction:"),
+                    dcc.RadioItems(
+                        id='flight-direction-radio',
+                        options=[
+                            {'label': 'Incoming Flights', 'value': 'incoming'},
+                            {'label': 'Outgoing Flights', 'value': 'outgoing'}
+                        ],
+                        value='incoming',
+                        inline=True
+                    ),
+                    dcc.Graph(id='connected-airports-map'),
+                    # Airport the map on screen was drawn for, None for a placeholder
+                    dcc.Store(id='connected-airports-map-drawn')
+                ], style={'marginTop': '20px'}),
+                html.Div([
+                    # When in the week and the day delays peak at the selected airport
+                    html.Label("Select Heatmap Metric:"),
+                    dcc.RadioItems(
+                        id='heatmap-metric-radio',
+                        options=[{'label': label, 'value': metric}
+                                 for metric, label in HEATMAP_METRICS.items()],
+                        value='avg_departure_delay',
+                        inline=True
+                    ),
+                    dcc.Graph(id='hourly-delay-heatmap'),
+                    # Airport the heatmap on screen was drawn for, None for a placeholder
+                    dcc.Store(id='hourly-delay-heatmap-drawn')
+                ], style={'marginTop': '20px'})
             ]),
-            html.Div([
+            
+            # Airline Tab
+            dcc.Tab(label='Airline Company', children=[
                 html.Div([
-                    # Dropdowns for state and airport
-                    html.Label("Select State:"),
+                    html.Label("Select Timeframe:"),
+                    dcc.DatePickerRange(
+                        id='airline-time-slicer',
+                        start_date=metadata['start_date'],
+                        end_date=metadata['end_date'],
+                        display_format='YYYY-MM-DD'
+                    ),
+                    html.Label("Select Visualization:"),
                     dcc.Dropdown(
-                        id='state-dropdown',
-                        options=[{'label': state, 'value': state} for state in states],
-                        placeholder="Select a state"
+                        id='airline-visualization-dropdown',
+                        options=[
+                            {'label': 'Popular Routes on Map', 'value': 'popular-routes'},
+                            {'label': 'Airport Traffic Hotspots', 'value': 'traffic-hotspots'}
+                        ],
+                        placeholder="Select a visualization"
                     ),
-                    html.Label("Select Airport:"),
+                    html.Div([
+                        dcc.Graph(id='geo-routes-map'),  # Replace iframe with Graph
+                        # Zoom level of the map above, used to pick the arc resolution
+                        dcc.Store(id='routes-map-scale', data=1),
+                        # Visualization the map on screen was drawn for, None for a placeholder
+                        dcc.Store(id='geo-routes-map-drawn'),
+                        # Route count and points per arc of the routes on screen
+                        dcc.Store(id='routes-map-arcs')
+                    ])
+                ])
+            ]),
+
+            dcc.Tab(label='Passenger', children=[
+                # Time slicer
+                html.Div([
+                    html.Label("Select Timeframe:"),
+                    dcc.DatePickerRange(
+                        id='passenger-time-slicer',
+                        start_date=metadata['start_date'],
+                        end_date=metadata['end_date'],
+                        display_format='YYYY-MM-DD',
+                        style={'marginBottom': '20px'}
+                    ),
+                ]),
+                
+                # Dropdown for selecting chart type
+                html.Div([
+                    html.Label("Select Category:"),
                     dcc.Dropdown(
-                        id='airport-dropdown',
-                        placeholder="Select an airport"
+                        id='passenger-bar-chart-dropdown',
+                        options=[
+                            {'label': 'Top 10 Airlines with Least Delay', 'value': 'least_delay'},
+                            {'label': 'Top 10 Airlines with Highest Delay', 'value': 'highest_delay'},
+                            {'label': 'Top 10 Airlines with Most Cancelled Flights', 'value': 'most_cancelled'},
+                            {'label': 'Top 10 Airlines with Most Diverted Flights', 'value': 'most_diverted'}
+                        ],
+                        placeholder="Select a category"
                     )
-                ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'}),
+                ], style={'marginTop': '20px'}),
+
+                # Bar chart
                 html.Div([
-                    # Map placeholder
-                    dcc.Graph(id='airport-map')
-                ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'})
+                    dcc.Graph(id='passenger-bar-chart'),
+                    # Ranking the chart on screen was drawn for, None for a placeholder
+                    dcc.Store(id='passenger-bar-chart-drawn')
+                ], style={'marginTop': '20px'})
             ]),
-            html.Div([
-                # Line chart for taxi delays
-                dcc.Graph(id='taxi-delay-line-chart')
-            ], style={'width': '100%', 'marginTop': '20px'}),
-            html.Div([
-                # Two pie charts
+
+            dcc.Tab(label='Delay Propagation', children=[
                 html.Div([
-                    dcc.Graph(id='delay-distribution-pie-chart'),
-                ], style={'width': '48%', 'display': 'inline-block'}),
+                    html.Label("Select Timeframe:"),
+                    dcc.DatePickerRange(
+                        id='rotation-time-slicer',
+                        start_date=metadata['start_date'],
+                        end_date=metadata['end_date'],
+                        display_format='YYYY-MM-DD',
+                        style={'marginBottom': '20px'}
+                    ),
+                    html.Label("Group By:"),
+                    dcc.RadioItems(
+                        id='rotation-group-radio',
+                        options=[
+                            {'label': 'Airline', 'value': 'AIRLINE_NAME'},
+                            {'label': 'Hub', 'value': 'ORIGIN_AIRPORT'}
+                        ],
+                        value='AIRLINE_NAME',
+                        inline=True
+                    )
+                ]),
                 html.Div([
-                    dcc.Graph(id='time-split-pie-chart'),
-                ], style={'width': '48%', 'display': 'inline-block'})
-            ], style={'marginTop': '20px'}),
-            html.Div([
-                # Map for top connected airports
-                html.Label("Select Flight Direction:"),
-                dcc.RadioItems(
-                    id='flight-direction-radio',
-                    options=[
-                        {'label': 'Incoming Flights', 'value': 'incoming'},
-                        {'label': 'Outgoing Flights', 'value': 'outgoing'}
-                    ],
-                    value='incoming',
-                    inline=True
-                ),
-                dcc.Graph(id='connected-airports-map')
-            ], style={'marginTop': '20px'})
-        ]),
-        
-        # Airline Tab
-        dcc.Tab(label='Airline Company', children=[
-            html.Div([
-                html.Label("Select Timeframe:"),
-                dcc.DatePickerRange(
-                    id='airline-time-slicer',
-                    start_date=main_df['Date'].min(),
-                    end_date=main_df['Date'].max(),
-                    display_format='YYYY-MM-DD'
-                ),
-                html.Label("Select Visualization:"),
-                dcc.Dropdown(
-                    id='airline-visualization-dropdown',
-                    options=[
-                        {'label': 'Popular Routes on Map', 'value': 'popular-routes'}
-                    ],
-                    placeholder="Select a visualization"
-                ),
+                    # How much inbound delay propagates to the next leg
+                    dcc.Graph(id='propagation-bar-chart')
+                ], style={'marginTop': '20px'}),
                 html.Div([
-                    dcc.Graph(id='geo-routes-map')  # Replace iframe with Graph
-                ])
+                    # Departure delay as the aircraft's day goes on
+                    dcc.Graph(id='leg-delay-line-chart'),
+                    # Grouping the rotation charts on screen were drawn for, None for placeholders
+                    dcc.Store(id='rotation-charts-drawn')
+                ], style={'marginTop': '20px'})
             ])
-        ]),
-
-        dcc.Tab(label='Passenger', children=[
-            # Time slicer
-            html.Div([
-                html.Label("Select Timeframe:"),
-                dcc.DatePickerRange(
-                    id='passenger-time-slicer',
-                    start_date=main_df['Date'].min(),
-                    end_date=main_df['Date'].max(),
-                    display_format='YYYY-MM-DD',
-                    style={'marginBottom': '20px'}
-                ),
-            ]),
-            
-            # Dropdown for selecting chart type
-            html.Div([
-                html.Label("Select Category:"),
-                dcc.Dropdown(
-                    id='passenger-bar-chart-dropdown',
-                    options=[
-                        {'label': 'Top 10 Airlines with Least Delay', 'value': 'least_delay'},
-                        {'label': 'Top 10 Airlines with Highest Delay', 'value': 'highest_delay'},
-                        {'label': 'Top 10 Airlines with Most Cancelled Flights', 'value': 'most_cancelled'},
-                        {'label': 'Top 10 Airlines with Most Diverted Flights', 'value': 'most_diverted'}
-                    ],
-                    placeholder="Select a category"
-                )
-            ], style={'marginTop': '20px'}),
-
-            # Bar chart
-            html.Div([
-                dcc.Graph(id='passenger-bar-chart')
-            ], style={'marginTop': '20px'})
-        ])
 
+        ])
     ])
-])
+
+
+app.layout = serve_layout
+
+
+@app.callback(
+    [Output('data-ready', 'data'),
+     Output('data-ready-poll', 'disabled')],
+    Input('data-ready-poll', 'n_intervals')
+)
+def poll_data_ready(_):
+    state = load_state()
+    if state is False:
+        raise PreventUpdate
+    return state, True
+
 
 @app.callback(
     Output('airport-dropdown', 'options'),
@@ -232,282 +340,689 @@ app.layout = html.Div([
 def update_airport_dropdown(selected_state):
     if not selected_state:
         return []
-    return [{'label': airport, 'value': airport} for airport in airports_by_state[selected_state]]
+    return [{'label': airport, 'value': airport} for airport in fq.airports_in_state(selected_state)]
+
+# Figures are assembled as plain dicts on top of layouts that went through plotly (and
+# its default template) once at startup. When only the data behind a chart changed,
+# callbacks send a Patch with the new traces and title instead of the whole figure. A
+# Patch keeps the layout on screen, so callbacks record what they last drew in a Store
+# and only patch over a figure of the same kind (see can_patch).
+def base_layout(**layout):
+    return go.Figure(layout=layout).to_plotly_json()['layout']
+
+
+USA_GEO = dict(
+    scope='usa',
+    projection=go.layout.geo.Projection(type='albers usa'),
+    showland=True,
+    landcolor='rgb(243, 243, 243)',
+    subunitwidth=1,
+    countrywidth=1,
+    subunitcolor="rgb(217, 217, 217)",
+    countrycolor="rgb(217, 217, 217)"
+)
+
+TAXI_LAYOUT = base_layout(xaxis_title='Date', yaxis_title='Delay (minutes)', legend_title='Taxi Type')
+PIE_LAYOUT = base_layout()
+GEO_LAYOUT = base_layout()
+# A constant uirevision keeps the user's zoom and pan when the map is redrawn or patched
+USA_GEO_LAYOUT = base_layout(geo=USA_GEO, showlegend=False, uirevision='usa-geo')
+BAR_LAYOUT = base_layout(xaxis_title="Airlines", yaxis_title="Count")
+HEATMAP_LAYOUT = base_layout(
+    xaxis=dict(title='Scheduled Departure Hour', dtick=1),
+    yaxis=dict(title='Day of Week', autorange='reversed')
+)
+LOADING_FIGURE = {'data': [], 'layout': {
+    **base_layout(xaxis={'visible': False}, yaxis={'visible': False}),
+    'annotations': [{'text': "Loading flight data…", 'showarrow': False, 'font': {'size': 18}}]
+}}
+LOAD_FAILED_FIGURE = {'data': [], 'layout': {
+    **base_layout(xaxis={'visible': False}, yaxis={'visible': False}),
+    'annotations': [{'text': "Flight data failed to load; see /ready and the server log",
+                     'showarrow': False, 'font': {'size': 18}}]
+}}
+ROTATION_GROUP_LABELS = {'AIRLINE_NAME': 'Airline', 'ORIGIN_AIRPORT': 'Hub'}
+PROPAGATION_LAYOUTS = {
+    group: base_layout(xaxis_title=label, yaxis_title='Late-aircraft delay / inbound delay')
+    for group, label in ROTATION_GROUP_LABELS.items()
+}
+# Legs past MAX_LEG share the last, open-ended category
+LEG_LAYOUT = base_layout(
+    xaxis=dict(title='Leg of the Day', type='category', categoryorder='array',
+               categoryarray=[str(leg) for leg in range(1, fq.MAX_LEG)] + [f"{fq.MAX_LEG}+"]),
+    yaxis_title='Avg Departure Delay (minutes)',
+    legend_title='Airline'
+)
+BUSY_TITLE = "Server busy, please retry shortly or pick a shorter date range"
+
+
+def loading_figure():
+    # Placeholder for charts while the data is not loaded
+    return LOAD_FAILED_FIGURE if fq.load_status['error'] else LOADING_FIGURE
+
+
+def render_figure(layout, traces, title, patch=False):
+    if not patch:
+        return {'data': traces, 'layout': {**layout, 'title': {'text': title}}}
+
+    # The traces are replaced whole, so a figure with a different number of them (an empty
+    # state, say) is not left with stale or half-defined traces
+    figure_patch = Patch()
+    figure_patch['data'] = traces
+    figure_patch['layout']['title']['text'] = title
+    return figure_patch
+
+
+def busy_figure(layout, patch=False):
+    # A shed query leaves the chart's data as it was and only says why it did not update.
+    # Without a chart to keep, it is an empty chart of the usual layout, so a later Patch
+    # fills in the data under the right axes.
+    if not patch:
+        return render_figure(layout, [], BUSY_TITLE)
+    figure_patch = Patch()
+    figure_patch['layout']['title']['text'] = BUSY_TITLE
+    return figure_patch
+
+
+def route_arcs_trace(origins, destinations, route_text, scale=1, **trace):
+    # One lines trace holding the cached great-circle arc of every route. Hover text sits on
+    # an invisible marker at each arc's midpoint instead of being repeated on every point.
+    lat, lon, points = route_polylines(fq.route_geometry, np.asarray(origins), np.asarray(destinations), scale)
+    # float32 arcs would serialize with spurious digits; 3 decimals is ~100 m
+    lat, lon = lat.astype(np.float64).round(3), lon.astype(np.float64).round(3)
+    middle = np.arange(len(route_text)) * (points + 1) + points // 2
+    return [
+        {'type': 'scattergeo', 'mode': 'lines', 'lat': lat, 'lon': lon, 'hoverinfo': 'skip', **trace},
+        {'type': 'scattergeo', 'mode': 'markers', 'lat': lat[middle], 'lon': lon[middle],
+         'text': np.asarray(route_text, dtype=object), 'hoverinfo': 'text', 'showlegend': False,
+         'marker': {'size': 6, 'opacity': 0}, **{key: value for key, value in trace.items() if key != 'line'}}
+    ]
+
+
+def triggered_by(*component_ids):
+    # True when this callback run was caused only by the given components
+    triggered = {item['prop_id'].split('.')[0] for item in ctx.triggered if item['prop_id'] != '.'}
+    return bool(triggered) and triggered <= set(component_ids)
+
+
+def can_patch(drawn, kind, *component_ids):
+    # A Patch is only sent over a figure that was drawn for the same kind of chart (not a
+    # placeholder or another visualization), and only when just the given inputs changed
+    return drawn == kind and triggered_by(*component_ids)
+
+
+DELAY_CAUSE_COLUMNS = {
+    'Air System': 'AIR_SYSTEM_DELAY',
+    'Security': 'SECURITY_DELAY',
+    'Airline': 'AIRLINE_DELAY',
+    'Late Aircraft': 'LATE_AIRCRAFT_DELAY',
+    'Weather': 'WEATHER_DELAY'
+}
+TIME_SPLIT_COLUMNS = {
+    'Departure Delay': 'DEPARTURE_DELAY',
+    'Arrival Delay': 'ARRIVAL_DELAY',
+    'Taxi In': 'TAXI_IN',
+    'Taxi Out': 'TAXI_OUT'
+}
+
+
+def approximation_note(totals=None, std_errors=None):
+    if std_errors is None:
+        return ""
+    return f" (approx. ±{fq.relative_error(totals, std_errors):.1%}, exact result loading…)"
+
+
+def build_airport_figures(selected_airport, daily_delays, totals, daily_errors=None, std_errors=None,
+                          patch=False):
+    daily_note = "" if daily_errors is None else " (approx., exact result loading…)"
+
+    # Taxi delays line chart, with 95% error bars when estimated from the sample
+    taxi_traces = []
+    for column, name in [('TAXI_IN', 'avg_taxi_in'), ('TAXI_OUT', 'avg_taxi_out')]:
+        error_y = None
+        if daily_errors is not None:
+            error_y = dict(type='data', array=fq.Z_95 * daily_errors[column].to_numpy(), visible=True)
+        taxi_traces.append({
+            'type': 'scatter', 'mode': 'lines', 'name': name,
+            'x': daily_delays.index, 'y': daily_delays[column].to_numpy(), 'error_y': error_y
+        })
+    taxi_fig = render_figure(TAXI_LAYOUT, taxi_traces,
+                             f"Average Daily Taxi Delays at {selected_airport}{daily_note}", patch)
+
+    # Delay Distribution Pie Chart
+    delay_totals = {label: totals[column] for label, column in DELAY_CAUSE_COLUMNS.items()}
+    delay_totals['Miscellaneous'] = max(0, totals['ARRIVAL_DELAY'] - sum(delay_totals.values()))
+    cause_columns = list(DELAY_CAUSE_COLUMNS.values())
+    delay_note = approximation_note(totals[cause_columns],
+                                    None if std_errors is None else std_errors[cause_columns])
+    delay_fig = render_figure(PIE_LAYOUT, [{
+        'type': 'pie', 'labels': list(delay_totals.keys()), 'values': list(delay_totals.values())
+    }], f"Delay Distribution{delay_note}", patch)
+
+    # Time Split Pie Chart
+    time_totals = {label: totals[column] for label, column in TIME_SPLIT_COLUMNS.items()}
+    time_columns = list(TIME_SPLIT_COLUMNS.values())
+    time_note = approximation_note(totals[time_columns],
+                                   None if std_errors is None else std_errors[time_columns])
+    time_fig = render_figure(PIE_LAYOUT, [{
+        'type': 'pie', 'labels': list(time_totals.keys()), 'values': list(time_totals.values())
+    }], f"Time Split{time_note}", patch)
+
+    return taxi_fig, delay_fig, time_fig
+
+
+def exact_airport_figures(selected_airport, start_date, end_date, patch=False):
+    if fq.day_aggregates is not None:
+        daily_rows = fq.airport_daily_stats(selected_airport, start_date, end_date).set_index('Date')
+
+        daily_delays = daily_rows[['TAXI_IN', 'TAXI_OUT']].div(daily_rows['flights'], axis=0)
+        totals = daily_rows[fq.SAMPLE_MEASURES].sum()
+
+        return build_airport_figures(selected_airport, daily_delays, totals, patch=patch)
+
+    # Filter dataset based on selected airport and time frame
+    view_df = fq.view_frame('airport-charts')
+    filtered_df = view_df[(view_df['ORIGIN_AIRPORT'] == selected_airport) &
+                          (view_df['Date'] >= start_date) &
+                          (view_df['Date'] <= end_date)]
+
+    daily_delays = filtered_df.groupby('Date')[['TAXI_IN', 'TAXI_OUT']].mean()
+    totals = filtered_df[fq.SAMPLE_MEASURES].sum()
+
+    return build_airport_figures(selected_airport, daily_delays, totals, patch=patch)
+
+
+def approximate_airport_figures(selected_airport, sample_rows, patch=False):
+    daily_delays, daily_errors = fq.stratified_daily_means(sample_rows, ['TAXI_IN', 'TAXI_OUT'])
+    totals, std_errors = fq.stratified_totals(sample_rows, fq.SAMPLE_MEASURES)
+
+    return build_airport_figures(selected_airport, daily_delays, totals, daily_errors, std_errors,
+                                 patch=patch)
+
 
 @app.callback(
     [Output('taxi-delay-line-chart', 'figure'),
      Output('airport-map', 'figure'),
      Output('delay-distribution-pie-chart', 'figure'),
-     Output('time-split-pie-chart', 'figure')],
+     Output('time-split-pie-chart', 'figure'),
+     Output('airport-charts-exact-request', 'data'),
+     Output('airport-charts-drawn', 'data')],
     [Input('state-dropdown', 'value'),
      Input('airport-dropdown', 'value'),
      Input('time-slicer', 'start_date'),
-     Input('time-slicer', 'end_date')]
+     Input('time-slicer', 'end_date'),
+     Input('data-ready', 'data')],
+    State('airport-charts-drawn', 'data')
 )
-def update_charts(selected_state, selected_airport, start_date, end_date):
+def update_charts(selected_state, selected_airport, start_date, end_date, _, drawn_airport):
     if not selected_state or not selected_airport or not start_date or not end_date:
-        return {}, {}, {}, {}
+        return {}, {}, {}, {}, None, None
+
+    # The sample is the first thing built after parsing; until then there is nothing to show.
+    # Aggregates read back from the cache come without a sample, and do not need one. The
+    # sample is released once the aggregates are published, so it is read once here.
+    sample_df = fq.sample_df
+    if sample_df is None and fq.day_aggregates is None:
+        placeholder = loading_figure()
+        return placeholder, placeholder, placeholder, placeholder, None, None
+
+    # A date change keeps the airport, so the map stays and the charts only get new data
+    patch = can_patch(drawn_airport, selected_airport, 'time-slicer')
+    if patch:
+        map_fig = no_update
+    else:
+        # Airport location map
+        airport_info = fq.airport_location(selected_airport)
+        map_fig = render_figure(GEO_LAYOUT, [{
+            'type': 'scattergeo', 'mode': 'markers+text',
+            'lat': airport_info['LATITUDE'].to_numpy(),
+            'lon': airport_info['LONGITUDE'].to_numpy(),
+            'text': airport_info['IATA_CODE'].to_numpy()
+        }], f"Location of {selected_airport}")
+
+    # The day aggregates answer exactly without a scan once they are built, so the sampled
+    # preview below only runs on a cold start, between parsing and the end of aggregation.
+    # A warm start reads the aggregates from the cache and never shows a preview.
+    if fq.day_aggregates is not None:
+        taxi_fig, delay_fig, time_fig = exact_airport_figures(selected_airport, start_date, end_date, patch)
+        return taxi_fig, map_fig, delay_fig, time_fig, None, selected_airport
+
+    sample_rows = sample_df[(sample_df['ORIGIN_AIRPORT'] == selected_airport) &
+                            (sample_df['Date'] >= start_date) &
+                            (sample_df['Date'] <= end_date)]
+
+    # The stratum sizes tell how many rows the exact query would scan
+    scanned_rows = sample_rows.groupby('Date')['stratum_rows'].first().sum()
+    if scanned_rows < PROGRESSIVE_MIN_ROWS:
+        taxi_fig, delay_fig, time_fig = exact_airport_figures(selected_airport, start_date, end_date, patch)
+        return taxi_fig, map_fig, delay_fig, time_fig, None, selected_airport
+
+    # Render an approximate result now and let update_exact_charts replace it
+    taxi_fig, delay_fig, time_fig = approximate_airport_figures(selected_airport, sample_rows, patch)
+    exact_request = {'airport': selected_airport, 'start_date': start_date, 'end_date': end_date}
+
+    return taxi_fig, map_fig, delay_fig, time_fig, exact_request, selected_airport
 
-    # Filter dataset based on selected airport and time frame
-    filtered_df = main_df[(main_df['ORIGIN_AIRPORT'] == selected_airport) &
-                          (main_df['Date'] >= start_date) &
-                          (main_df['Date'] <= end_date)]
-
-    # Taxi delays line chart
-    daily_delays = filtered_df.groupby('Date').agg(
-        avg_taxi_in=('TAXI_IN', 'mean'),
-        avg_taxi_out=('TAXI_OUT', 'mean')
-    ).reset_index()
-
-    taxi_fig = px.line(
-        daily_delays, x='Date', y=['avg_taxi_in', 'avg_taxi_out'],
-        labels={'Date': 'Date', 'value': 'Delay (minutes)', 'variable': 'Taxi Type'},
-        title=f"Average Daily Taxi Delays at {selected_airport}"
-    )
-
-    # Airport location map
-    airport_info = airport_coords[airport_coords['ORIGIN_AIRPORT'] == selected_airport]
-    map_fig = px.scatter_geo(
-        airport_info,
-        lat='origin_lat',
-        lon='origin_long',
-        text='ORIGIN_AIRPORT',
-        title=f"Location of {selected_airport}"
-    )
 
-    # Delay Distribution Pie Chart
-    delay_totals = {
-        'Air System': filtered_df['AIR_SYSTEM_DELAY'].sum(),
-        'Security': filtered_df['SECURITY_DELAY'].sum(),
-        'Airline': filtered_df['AIRLINE_DELAY'].sum(),
-        'Late Aircraft': filtered_df['LATE_AIRCRAFT_DELAY'].sum(),
-        'Weather': filtered_df['WEATHER_DELAY'].sum(),
-        'Miscellaneous': max(0, filtered_df['ARRIVAL_DELAY'].sum() -
-                             (filtered_df['AIR_SYSTEM_DELAY'].sum() +
-                              filtered_df['SECURITY_DELAY'].sum() +
-                              filtered_df['AIRLINE_DELAY'].sum() +
-                              filtered_df['LATE_AIRCRAFT_DELAY'].sum() +
-                              filtered_df['WEATHER_DELAY'].sum()))
-    }
-    delay_fig = px.pie(
-        names=list(delay_totals.keys()),
-        values=list(delay_totals.values()),
-        title="Delay Distribution"
-    )
-
-    # Time Split Pie Chart
-    time_totals = {
-        'Departure Delay': filtered_df['DEPARTURE_DELAY'].sum(),
-        'Arrival Delay': filtered_df['ARRIVAL_DELAY'].sum(),
-        'Taxi In': filtered_df['TAXI_IN'].sum(),
-        'Taxi Out': filtered_df['TAXI_OUT'].sum()
-    }
-    time_fig = px.pie(
-        names=list(time_totals.keys()),
-        values=list(time_totals.values()),
-        title="Time Split"
-    )
+@app.callback(
+    [Output('taxi-delay-line-chart', 'figure', allow_duplicate=True),
+     Output('delay-distribution-pie-chart', 'figure', allow_duplicate=True),
+     Output('time-split-pie-chart', 'figure', allow_duplicate=True)],
+    Input('airport-charts-exact-request', 'data'),
+    prevent_initial_call=True
+)
+def update_exact_charts(exact_request):
+    if not exact_request:
+        raise PreventUpdate
 
-    return taxi_fig, map_fig, delay_fig, time_fig
+    # The approximate figures are already on screen; only their data and titles change
+    return exact_airport_figures(exact_request['airport'],
+                                 exact_request['start_date'],
+                                 exact_request['end_date'],
+                                 patch=True)
 
 
 @app.callback(
-    Output('connected-airports-map', 'figure'),
+    [Output('connected-airports-map', 'figure'),
+     Output('connected-airports-map-drawn', 'data')],
     [Input('airport-dropdown', 'value'),
      Input('time-slicer', 'start_date'),
      Input('time-slicer', 'end_date'),
-     Input('flight-direction-radio', 'value')]
+     Input('flight-direction-radio', 'value'),
+     Input('data-ready', 'data')],
+    State('connected-airports-map-drawn', 'data')
 )
-def update_connected_airports_map(selected_airport, start_date, end_date, flight_direction):
+def update_connected_airports_map(selected_airport, start_date, end_date, flight_direction, _, drawn_airport):
     if not selected_airport or not start_date or not end_date or not flight_direction:
-        return {}
+        return {}, None
+    if not fq.data_ready.is_set():
+        return loading_figure(), None
 
-    # Filter dataset based on time frame
-    filtered_df = main_df[(main_df['Date'] >= start_date) & (main_df['Date'] <= end_date)]
+    # A busy server answers from the monthly route level instead of the daily one
+    with admission(fq.query_cost('connected-airports', start_date, end_date)) as admitted:
+        top_df = fq.top_connected_airports(selected_airport, start_date, end_date, flight_direction,
+                                        coarse=not admitted)
+    note = "" if admitted else coarse_note(start_date, end_date)
 
+    # Arcs between the selected airport and each connected one, drawn in the flight direction
     if flight_direction == 'incoming':
-        # Get incoming flights to the selected airport
-        connected_df = filtered_df[filtered_df['DESTINATION_AIRPORT'] == selected_airport]
-        top_airports = connected_df['ORIGIN_AIRPORT'].value_counts().head(7).index
-        top_df = connected_df[connected_df['ORIGIN_AIRPORT'].isin(top_airports)]
-        lat_col, lon_col = 'origin_lat', 'origin_long'
-        airport_column = 'ORIGIN_AIRPORT'
+        origins, destinations = top_df['AIRPORT'], np.full(len(top_df), selected_airport, dtype=object)
     else:
-        # Get outgoing flights from the selected airport
-        connected_df = filtered_df[filtered_df['ORIGIN_AIRPORT'] == selected_airport]
-        top_airports = connected_df['DESTINATION_AIRPORT'].value_counts().head(7).index
-        top_df = connected_df[connected_df['DESTINATION_AIRPORT'].isin(top_airports)]
-        lat_col, lon_col = 'dest_lat', 'dest_long'
-        airport_column = 'DESTINATION_AIRPORT'
-
-    # Ensure the filtered dataset only includes the relevant rows
-    top_df = top_df.groupby(airport_column).first().reset_index()
+        origins, destinations = np.full(len(top_df), selected_airport, dtype=object), top_df['AIRPORT']
+    arc_text = (top_df['AIRPORT'] + " (" + top_df['flights'].astype(str) + " flights)").to_numpy()
+
+    traces = route_arcs_trace(origins, destinations, arc_text, line=dict(width=1.5, color='grey'))
+
+    # Create the map, marker areas scaled like px.scatter_geo's default size_max of 20
+    traces.append({
+        'type': 'scattergeo', 'mode': 'markers+text',
+        'lat': top_df['LATITUDE'].to_numpy(),
+        'lon': top_df['LONGITUDE'].to_numpy(),
+        'text': top_df['AIRPORT'].to_numpy(),
+        'marker': {'size': top_df['flights'].to_numpy(), 'sizemode': 'area',
+                   'sizeref': 2 * max(top_df['flights'].max(), 1) / 20 ** 2}
+    })
+    map_fig = render_figure(GEO_LAYOUT, traces,
+                            f"Top 7 Connected Airports ({flight_direction.capitalize()} Flights){note}",
+                            patch=can_patch(drawn_airport, selected_airport,
+                                            'time-slicer', 'flight-direction-radio'))
 
-    # Create the map
-    map_fig = px.scatter_geo(
-        top_df,
-        lat=lat_col,
-        lon=lon_col,
-        text=airport_column,
-        title=f"Top 7 Connected Airports ({flight_direction.capitalize()} Flights)",
-        size=top_df.groupby(airport_column).size(),
-    )
+    return map_fig, selected_airport
 
-    return map_fig
 
+@app.callback(
+    [Output('hourly-delay-heatmap', 'figure'),
+     Output('hourly-delay-heatmap-drawn', 'data')],
+    [Input('airport-dropdown', 'value'),
+     Input('time-slicer', 'start_date'),
+     Input('time-slicer', 'end_date'),
+     Input('heatmap-metric-radio', 'value'),
+     Input('data-ready', 'data')],
+    State('hourly-delay-heatmap-drawn', 'data')
+)
+def update_hourly_heatmap(selected_airport, start_date, end_date, metric, _, drawn_airport):
+    if not selected_airport or not start_date or not end_date or not metric:
+        return {}, None
+    if not fq.data_ready.is_set():
+        return loading_figure(), None
+
+    profile = fq.hourly_delay_profile(selected_airport, start_date, end_date)
+    grid = profile.pivot(index='weekday', columns='HOUR', values=metric)
+
+    return render_figure(HEATMAP_LAYOUT, [{
+        'type': 'heatmap', 'x': grid.columns.to_numpy(), 'y': WEEKDAYS, 'z': grid.to_numpy(),
+        'colorscale': 'YlOrRd', 'colorbar': {'title': {'text': HEATMAP_METRICS[metric]}},
+        'hoverongaps': False
+    }], f"{HEATMAP_METRICS[metric]} by Hour and Weekday at {selected_airport}",
+        patch=can_patch(drawn_airport, selected_airport, 'time-slicer', 'heatmap-metric-radio')), selected_airport
+
+
+
+
+def popular_routes_figure(start_date, end_date, map_scale, patch, coarse=False):
+    # Returns the figure and the arc resolution it was drawn at (None when there are no routes)
+    # Calculate total flights handled (incoming + outgoing)
+    route_df = fq.route_counts(start_date, end_date, coarse)
+
+    # Merge with airport coordinates
+    origin_coords = fq.airport_df.rename(columns={'IATA_CODE': 'ORIGIN_AIRPORT'})
+    dest_coords = fq.airport_df.rename(columns={'IATA_CODE': 'DESTINATION_AIRPORT'})
+    route_df = route_df.merge(origin_coords[['ORIGIN_AIRPORT', 'LATITUDE', 'LONGITUDE']],
+                              on='ORIGIN_AIRPORT', how='left')
+    route_df = route_df.merge(dest_coords[['DESTINATION_AIRPORT', 'LATITUDE', 'LONGITUDE']],
+                              on='DESTINATION_AIRPORT', how='left')
+
+    # Validate route_df
+    if route_df.empty:
+        return render_figure(USA_GEO_LAYOUT, [], "No Routes Available", patch), None
+
+    note = coarse_note(start_date, end_date) if coarse else ""
+
+    # All routes go into one lines trace of cached great-circle arcs, separated by gaps
+    route_text = ("Route: " + route_df['ORIGIN_AIRPORT'] + " → " + route_df['DESTINATION_AIRPORT'] +
+                  " (" + route_df['flight_count'].astype(str) + " flights)").to_numpy()
+    traces = route_arcs_trace(route_df['ORIGIN_AIRPORT'], route_df['DESTINATION_AIRPORT'],
+                              route_text, map_scale,
+                              line=dict(width=2, color='blue'), locationmode='USA-states')
+
+    # Add place markers for airports
+    for airport_column, suffix in [('ORIGIN_AIRPORT', '_x'), ('DESTINATION_AIRPORT', '_y')]:
+        traces.append({
+            'type': 'scattergeo', 'locationmode': 'USA-states', 'mode': 'markers',
+            'lon': route_df['LONGITUDE' + suffix].to_numpy(),
+            'lat': route_df['LATITUDE' + suffix].to_numpy(),
+            'marker': dict(size=8, symbol='circle'),
+            'text': route_df[airport_column].to_numpy(),
+            'hoverinfo': 'text'
+        })
+
+    arcs = {'routes': len(route_df), 'points': arc_points_for_scale(map_scale, len(route_df))}
+    return render_figure(USA_GEO_LAYOUT, traces, f"Popular Routes{note}", patch), arcs
 
 
+@app.callback(
+    Output('routes-map-scale', 'data'),
+    Input('geo-routes-map', 'relayoutData')
+)
+def update_routes_map_scale(relayout_data):
+    # Only zooming can change how many points each arc needs; panning and resizing do not
+    if not relayout_data or 'geo.projection.scale' not in relayout_data:
+        raise PreventUpdate
+    return relayout_data['geo.projection.scale']
+
+
+def traffic_hotspots_figure(start_date, end_date, patch=False):
+    bins = fq.hotspot_bins(start_date, end_date)
+    if bins.empty:
+        return render_figure(USA_GEO_LAYOUT, [], "No Traffic Available", patch)
+
+    # One square marker per non-empty grid cell, coloured by (log) flight volume
+    return render_figure(USA_GEO_LAYOUT, [{
+        'type': 'scattergeo', 'locationmode': 'USA-states', 'mode': 'markers',
+        'lon': bins['LONGITUDE'].to_numpy(),
+        'lat': bins['LATITUDE'].to_numpy(),
+        'marker': dict(
+            symbol='square',
+            size=14,
+            opacity=0.8,
+            color=np.log10(bins['flights'].to_numpy()),
+            colorscale='YlOrRd',
+            colorbar=dict(title='Flights (log10)')
+        ),
+        'text': bins['flights'].map(lambda flights: f"{flights:,} flights").to_numpy(),
+        'hoverinfo': 'text'
+    }], f"Airport Traffic Hotspots ({fq.HOTSPOT_GRID_DEGREES:g}° grid, incoming + outgoing)", patch)
 
-import geopandas as gpd
-import plotly.express as px
-from shapely.geometry import LineString
 
 @app.callback(
-    Output('geo-routes-map', 'figure'),
+    [Output('geo-routes-map', 'figure'),
+     Output('geo-routes-map-drawn', 'data'),
+     Output('routes-map-arcs', 'data')],
     [Input('airline-time-slicer', 'start_date'),
      Input('airline-time-slicer', 'end_date'),
-     Input('airline-visualization-dropdown', 'value')]
+     Input('airline-visualization-dropdown', 'value'),
+     Input('routes-map-scale', 'data'),
+     Input('data-ready', 'data')],
+    [State('geo-routes-map-drawn', 'data'),
+     State('routes-map-arcs', 'data')]
 )
-def update_geopandas_map(start_date, end_date, selected_chart):
+def update_geopandas_map(start_date, end_date, selected_chart, map_scale, _, drawn_chart, drawn_arcs):
     if not start_date or not end_date or not selected_chart:
-        return {}
-
-    # Filter the data based on the selected timeframe
-    filtered_df = main_df[(main_df['Date'] >= start_date) & (main_df['Date'] <= end_date)]
+        return {}, None, None
+    if not fq.data_ready.is_set():
+        return loading_figure(), None, None
+
+    # A zoom only redraws the routes when it crosses into another arc resolution; the
+    # browser keeps the zoom itself (uirevision), so otherwise nothing needs to be sent
+    if triggered_by('routes-map-scale'):
+        if selected_chart != 'popular-routes':
+            return no_update, no_update, no_update
+        if (drawn_chart == 'popular-routes' and drawn_arcs and
+                arc_points_for_scale(map_scale, drawn_arcs['routes']) == drawn_arcs['points']):
+            return no_update, no_update, no_update
+
+    # Switching the date range or zooming keeps the chart type, so only its data is sent
+    patch = can_patch(drawn_chart, selected_chart, 'airline-time-slicer', 'routes-map-scale')
 
     if selected_chart == 'popular-routes':
-        # Calculate total flights handled (incoming + outgoing)
-        route_df = filtered_df.groupby(['ORIGIN_AIRPORT', 'DESTINATION_AIRPORT']).size().reset_index(name='flight_count')
-
-        # Merge with airport coordinates
-        origin_coords = airport_df.rename(columns={'IATA_CODE': 'ORIGIN_AIRPORT'})
-        dest_coords = airport_df.rename(columns={'IATA_CODE': 'DESTINATION_AIRPORT'})
-        route_df = route_df.merge(origin_coords[['ORIGIN_AIRPORT', 'LATITUDE', 'LONGITUDE']],
-                                  on='ORIGIN_AIRPORT', how='left')
-        route_df = route_df.merge(dest_coords[['DESTINATION_AIRPORT', 'LATITUDE', 'LONGITUDE']],
-                                  on='DESTINATION_AIRPORT', how='left')
-
-        # Validate route_df
-        if route_df.empty:
-            return px.scatter_geo(title="No Routes Available")
-
-        # Create the map using scatter_geo for lines
-        fig = go.Figure()
-
-        for _, row in route_df.iterrows():
-            fig.add_trace(
-                go.Scattergeo(
-                    locationmode='USA-states',
-                    lon=[row['LONGITUDE_x'], row['LONGITUDE_y']],
-                    lat=[row['LATITUDE_x'], row['LATITUDE_y']],
-                    mode='lines',
-                    line=dict(width=2, color='blue'),
-                    hoverinfo='text',
-                    text=f"Route: {row['ORIGIN_AIRPORT']} → {row['DESTINATION_AIRPORT']} ({row['flight_count']} flights)"
-                )
-            )
-
-        # Add place markers for airports
-        fig.add_trace(
-            go.Scattergeo(
-                locationmode='USA-states',
-                lon=route_df['LONGITUDE_x'],
-                lat=route_df['LATITUDE_x'],
-                mode='markers',
-                marker=dict(size=8, symbol='circle'),
-                text=route_df['ORIGIN_AIRPORT'],
-                hoverinfo='text'
-            )
-        )
-        fig.add_trace(
-            go.Scattergeo(
-                locationmode='USA-states',
-                lon=route_df['LONGITUDE_y'],
-                lat=route_df['LATITUDE_y'],
-                mode='markers',
-                marker=dict(size=8, symbol='circle'),
-                text=route_df['DESTINATION_AIRPORT'],
-                hoverinfo='text'
-            )
-        )
-
-        # Update map layout
-        fig.update_layout(
-            title="Popular Routes",
-            geo=dict(
-                scope='usa',
-                projection=go.layout.geo.Projection(type='albers usa'),
-                showland=True,
-                landcolor='rgb(243, 243, 243)',
-                subunitwidth=1,
-                countrywidth=1,
-                subunitcolor="rgb(217, 217, 217)",
-                countrycolor="rgb(217, 217, 217)"
-            )
-        )
-
-        return fig
-
-    return {}
+        # Long ranges need one of the few expensive-query slots; without one the map is drawn
+        # from monthly route totals at the coarsest arc resolution
+        with admission(fq.query_cost('popular-routes', start_date, end_date, map_scale=map_scale)) as admitted:
+            if admitted:
+                figure, arcs = popular_routes_figure(start_date, end_date, map_scale, patch)
+                return figure, selected_chart, arcs
+        figure, arcs = popular_routes_figure(start_date, end_date, 0, patch, coarse=True)
+        return figure, selected_chart, arcs
+
+    if selected_chart == 'traffic-hotspots':
+        return traffic_hotspots_figure(start_date, end_date, patch), selected_chart, None
+
+    return {}, None, None
 
 
 
 @app.callback(
-    Output('passenger-bar-chart', 'figure'),
+    [Output('passenger-bar-chart', 'figure'),
+     Output('passenger-bar-chart-drawn', 'data')],
     [Input('passenger-time-slicer', 'start_date'),
      Input('passenger-time-slicer', 'end_date'),
-     Input('passenger-bar-chart-dropdown', 'value')]
+     Input('passenger-bar-chart-dropdown', 'value'),
+     Input('data-ready', 'data')],
+    State('passenger-bar-chart-drawn', 'data')
 )
-def update_passenger_bar_chart(start_date, end_date, selected_category):
+def update_passenger_bar_chart(start_date, end_date, selected_category, _, drawn_category):
     if not start_date or not end_date or not selected_category:
-        return {}
+        return {}, None
+    if not fq.data_ready.is_set():
+        return loading_figure(), None
 
-    # Filter data by selected timeframe
-    filtered_df = main_df[(main_df['Date'] >= start_date) & (main_df['Date'] <= end_date)]
+    # A date change keeps the ranking, so only the bars and title are sent
+    patch = can_patch(drawn_category, selected_category, 'passenger-time-slicer')
 
     # Initialize variables
     x = []
     y = []
     title = ""
 
-    if selected_category in ['least_delay', 'highest_delay']:
-        # Calculate total delays
-        filtered_df['TOTAL_DELAY'] = filtered_df['DEPARTURE_DELAY'] + filtered_df['ARRIVAL_DELAY']
-        agg_df = filtered_df.groupby('AIRLINE_NAME').agg({'TOTAL_DELAY': 'sum'}).reset_index()
-
-        # Sort and filter top 10
-        if selected_category == 'least_delay':
-            agg_df = agg_df.sort_values('TOTAL_DELAY', ascending=True).head(10)
-            title = "Top 10 Airlines with Least Delay"
-        else:
-            agg_df = agg_df.sort_values('TOTAL_DELAY', ascending=False).head(10)
-            title = "Top 10 Airlines with Highest Delay"
-
-        x = agg_df['AIRLINE_NAME']
-        y = agg_df['TOTAL_DELAY']
-
-    elif selected_category in ['most_cancelled', 'most_diverted']:
-        col = 'CANCELLED' if selected_category == 'most_cancelled' else 'DIVERTED'
-        agg_df = filtered_df.groupby('AIRLINE_NAME').agg({col: 'sum'}).reset_index()
-
-        # Sort and filter top 10
-        agg_df = agg_df.sort_values(col, ascending=False).head(10)
-        title = "Top 10 Airlines with Most Cancelled Flights" if col == 'CANCELLED' else "Top 10 Airlines with Most Diverted Flights"
+    if selected_category in fq.AIRLINE_RANKINGS:
+        column, _, title = fq.AIRLINE_RANKINGS[selected_category]
+        with admission(fq.query_cost('passenger-bar-chart', start_date, end_date)) as admitted:
+            if not admitted:
+                return busy_figure(BAR_LAYOUT, patch), selected_category
+            agg_df = fq.airline_rankings(selected_category, start_date, end_date)
 
         x = agg_df['AIRLINE_NAME']
-        y = agg_df[col]
+        y = agg_df[column]
 
     # Create bar chart
-    fig = px.bar(
-        x=x,
-        y=y,
-        labels={'x': 'Airlines', 'y': 'Count'},
-        title=title
-    )
-    fig.update_layout(xaxis_title="Airlines", yaxis_title="Count")
+    return render_figure(BAR_LAYOUT, [{'type': 'bar', 'x': np.asarray(x), 'y': np.asarray(y)}], title,
+                         patch), selected_category
 
-    return fig
 
+@app.callback(
+    [Output('propagation-bar-chart', 'figure'),
+     Output('leg-delay-line-chart', 'figure'),
+     Output('rotation-charts-drawn', 'data')],
+    [Input('rotation-time-slicer', 'start_date'),
+     Input('rotation-time-slicer', 'end_date'),
+     Input('rotation-group-radio', 'value'),
+     Input('data-ready', 'data')],
+    State('rotation-charts-drawn', 'data')
+)
+def update_rotation_charts(start_date, end_date, group, _, drawn_group):
+    if not start_date or not end_date or not group:
+        return {}, {}, None
+    if not fq.data_ready.is_set():
+        return loading_figure(), loading_figure(), None
+
+    # A date change keeps the grouping, so both charts only get new data
+    patch = can_patch(drawn_group, group, 'rotation-time-slicer')
+    group_label = ROTATION_GROUP_LABELS[group]
+
+    # No coarser level exists for rotations, so a busy server sheds these queries
+    with admission(fq.query_cost('delay-propagation', start_date, end_date, group=group)) as admitted:
+        if not admitted:
+            return busy_figure(PROPAGATION_LAYOUTS[group], patch), busy_figure(LEG_LAYOUT, patch), group
+        propagation_df = fq.delay_propagation(group, start_date, end_date)
+        leg_df = fq.delay_by_leg(start_date, end_date)
+
+    propagation_fig = render_figure(PROPAGATION_LAYOUTS[group], [{
+        'type': 'bar',
+        'x': propagation_df[group].to_numpy(),
+        'y': propagation_df['propagation_ratio'].to_numpy(),
+        'customdata': propagation_df[['linked', 'inbound_delay', 'late_aircraft_delay']].to_numpy(),
+        'hovertemplate': (f"{group_label}: %{{x}}<br>Ratio: %{{y:.3f}}<br>Linked legs: %{{customdata[0]}}"
+                          "<br>Inbound delay: %{customdata[1]}<br>Late-aircraft delay: %{customdata[2]}"
+                          "<extra></extra>")
+    }], f"Delay Propagated Through Aircraft Rotations by {group_label}", patch)
+
+    # One line per airline across the legs of the day
+    leg_traces = [{
+        'type': 'scatter', 'mode': 'lines+markers', 'name': airline,
+        'x': legs['leg_label'].to_numpy(), 'y': legs['avg_departure_delay'].to_numpy()
+    } for airline, legs in leg_df.groupby('AIRLINE_NAME')]
+    leg_fig = render_figure(LEG_LAYOUT, leg_traces, "Average Departure Delay by Leg of the Aircraft's Day", patch)
+
+    return propagation_fig, leg_fig, group
+
+
+# Read-only data API: the same aggregates the callbacks use, as Arrow IPC streams
+# (or JSON with ?format=json, or when pyarrow is not installed)
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+arrow_tables = {}
+
+
+def arrow_module():
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def wants_arrow():
+    requested = request.args.get('format')
+    if requested:
+        return requested == 'arrow' and arrow_module() is not None
+    best = request.accept_mimetypes.best_match([ARROW_STREAM_MIMETYPE, 'application/json'])
+    return best != 'application/json' and arrow_module() is not None
+
+
+def arrow_response(table):
+    pa = arrow_module()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM_MIMETYPE)
+
+
+def frame_response(frame):
+    # For computed results (rankings, route counts). These are grouped over the date range
+    # and are at most one row per route or airline, so converting them costs as much as the
+    # output, not the table. Only airport-daily returns raw aggregate rows, and it slices
+    # a cached Arrow table instead.
+    if wants_arrow():
+        return arrow_response(arrow_module().Table.from_pandas(frame, preserve_index=False))
+    return Response(frame.to_json(orient='records', date_format='iso'), mimetype='application/json')
+
+
+@app.server.route('/ready')
+def ready():
+    # Readiness probe: 200 once the data is loaded, 503 while loading, 500 if loading failed
+    status = 200 if fq.data_ready.is_set() else 500 if fq.load_status['error'] else 503
+    return jsonify(ready=fq.data_ready.is_set(), admission=admission_stats, **fq.load_status), status
+
+
+DATE_ARGS = ('start', 'end')
+
+
+def required_args(*names):
+    if not fq.data_ready.is_set():
+        abort(503, description="Flight data is still loading")
+    missing = [name for name in names if not request.args.get(name)]
+    if missing:
+        abort(400, description=f"Missing query parameters: {', '.join(missing)}")
+
+    values = [request.args[name] for name in names]
+    # Dates are parsed here so a malformed one is the client's error, not a 500 from the query
+    for i, name in enumerate(names):
+        if name in DATE_ARGS:
+            try:
+                values[i] = pd.Timestamp(values[i])
+            except ValueError:
+                abort(400, description=f"{name} is not a valid date: {values[i]!r}")
+    return values
+
+
+def shed_unless(admitted):
+    # API clients expect exact data, so a busy server sheds the request rather than degrading it
+    if not admitted:
+        raise ServiceUnavailable("Server is busy, retry shortly", retry_after=int(np.ceil(QUEUE_TIMEOUT)))
+
+
+@app.server.route('/api/airport-daily')
+def api_airport_daily():
+    airport, start_date, end_date = required_args('airport', 'start', 'end')
+    if not wants_arrow():
+        return frame_response(fq.airport_daily_stats(airport, start_date, end_date))
+
+    # Slices of the cached Arrow table share its buffers, so nothing is copied until written out
+    if 'airport_daily' not in arrow_tables:
+        arrow_tables['airport_daily'] = arrow_module().Table.from_pandas(
+            fq.day_aggregates['airport_daily'], preserve_index=False)
+    start, stop = fq.airport_bounds('airport_daily', airport, start_date, end_date)
+    return arrow_response(arrow_tables['airport_daily'].slice(start, stop - start))
+
+
+@app.server.route('/api/top-connected-airports')
+def api_top_connected_airports():
+    airport, start_date, end_date = required_args('airport', 'start', 'end')
+    direction = request.args.get('direction', 'incoming')
+    if direction not in ('incoming', 'outgoing'):
+        abort(400, description="direction must be 'incoming' or 'outgoing'")
+    with admission(fq.query_cost('connected-airports', start_date, end_date)) as admitted:
+        shed_unless(admitted)
+        return frame_response(fq.top_connected_airports(airport, start_date, end_date, direction,
+                                                     n=request.args.get('n', 7, type=int)))
+
+
+@app.server.route('/api/route-counts')
+def api_route_counts():
+    start_date, end_date = required_args('start', 'end')
+    with admission(fq.query_cost('route-counts', start_date, end_date)) as admitted:
+        shed_unless(admitted)
+        return frame_response(fq.route_counts(start_date, end_date))
+
+
+@app.server.route('/api/airline-rankings')
+def api_airline_rankings():
+    category, start_date, end_date = required_args('category', 'start', 'end')
+    if category not in fq.AIRLINE_RANKINGS:
+        abort(400, description=f"category must be one of: {', '.join(fq.AIRLINE_RANKINGS)}")
+    with admission(fq.query_cost('airline-rankings', start_date, end_date)) as admitted:
+        shed_unless(admitted)
+        return frame_response(fq.airline_rankings(category, start_date, end_date,
+                                               n=request.args.get('n', 10, type=int)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# Files under .cache are read by whichever process gets there first (the debug reloader
+# runs two, and a notebook may load alongside the dashboard), so they are written to a
+# temporary file in the same directory and renamed into place. A reader sees either no
+# file or a complete one, never a half-written one.
+
+
+def write_atomically(path, write):
+    # write(temp_path) writes the content; the temporary name keeps path's extension
+    # because np.savez and pd.to_pickle go by it
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    base, extension = os.path.splitext(os.path.basename(path))
+    handle, temp_path = tempfile.mkstemp(prefix=f"{base}.", suffix=f".tmp{extension}", dir=directory)
+    os.close(handle)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,589 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import (AGGREGATE_KEYS, AIRPORT_MEASURES, HOURLY_MEASURES, build_day_aggregates,
+                        build_route_months, build_traffic_grid)
+from cache_files import write_atomically
+from route_geometry import arc_points_for_scale, build_route_geometry
+from rotations import MAX_LEG, ROTATION_COLUMNS, build_rotation_aggregates, load_or_link_rotations
+
+# Query API over the flight data, shared by the dashboard (app.py) and notebooks:
+#
+#     import flight_queries as fq
+#     fq.load()
+#     fq.route_counts('2015-01-01', '2015-03-31')
+#
+# load() fills the module state below and builds in-process by default, so it works from
+# any script or notebook. load(workers=N) builds the aggregates of a cold start in a pool
+# of N processes, which re-import the caller's __main__: only pass it from a main module
+# that is guarded by `if __name__ == '__main__':` (the dashboard passes AGGREGATE_WORKERS).
+# Everything derived from flights.csv is cached under .cache, keyed by the size and mtime
+# of the CSVs it was built from, so once the dashboard (or any other caller) has loaded
+# the data, later loads only read the aggregates back.
+
+# Column projection: every view declares the flights.csv columns it reads and the
+# loader only parses, keeps and caches the union of those declarations.
+FLIGHTS_CSV = 'flights.csv'
+AIRPORTS_CSV = 'airports.csv'
+AIRLINES_CSV = 'airlines.csv'
+COLUMN_CACHE_DIR = os.path.join('.cache', 'flight_columns')
+
+# Needed by every view: the date parts and the keys joined against airports/airlines
+BASE_COLUMNS = ['YEAR', 'MONTH', 'DAY', 'AIRLINE', 'ORIGIN_AIRPORT', 'DESTINATION_AIRPORT']
+
+VIEW_COLUMNS = {
+    'airport-charts': ['TAXI_IN', 'TAXI_OUT', 'AIR_SYSTEM_DELAY', 'SECURITY_DELAY',
+                       'AIRLINE_DELAY', 'LATE_AIRCRAFT_DELAY', 'WEATHER_DELAY',
+                       'ARRIVAL_DELAY', 'DEPARTURE_DELAY'],
+    'connected-airports': [],
+    'popular-routes': [],
+    'passenger-bar-chart': ['DEPARTURE_DELAY', 'ARRIVAL_DELAY', 'CANCELLED', 'DIVERTED'],
+    'delay-propagation': ROTATION_COLUMNS,
+    'delay-heatmap': ['SCHEDULED_DEPARTURE', 'DEPARTURE_DELAY', 'TAXI_OUT', 'CANCELLED']
+}
+
+
+def register_view_columns(view, columns):
+    # Views registered after loading get their extra columns on first use (see view_frame)
+    VIEW_COLUMNS[view] = list(columns)
+
+
+def projected_columns():
+    columns = list(BASE_COLUMNS)
+    for view_columns in VIEW_COLUMNS.values():
+        columns += [column for column in view_columns if column not in columns]
+    return columns
+
+
+def csv_stamp(path=FLIGHTS_CSV):
+    # The CSV's size and mtime go into cache file names so a new extract never hits stale caches
+    stat = os.stat(path)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def column_cache_path(column):
+    return os.path.join(COLUMN_CACHE_DIR, f"{column}-{csv_stamp()}.pkl")
+
+
+def read_flight_columns(columns):
+    loaded = {}
+    missing = []
+    for column in columns:
+        path = column_cache_path(column)
+        if os.path.exists(path):
+            loaded[column] = pd.read_pickle(path)
+        else:
+            missing.append(column)
+
+    # Parse only the columns that are not cached yet, then cache them one file per column
+    if missing:
+        parsed = pd.read_csv(FLIGHTS_CSV, usecols=missing, low_memory=False)
+        os.makedirs(COLUMN_CACHE_DIR, exist_ok=True)
+        for column in missing:
+            write_atomically(column_cache_path(column), parsed[column].to_pickle)
+            loaded[column] = parsed[column]
+
+    return pd.DataFrame({column: loaded[column] for column in columns})
+
+
+def read_lookup_tables():
+    airport_df = pd.read_csv(AIRPORTS_CSV)
+    airline_df = pd.read_csv(AIRLINES_CSV).iloc[:, :2].rename(columns={
+        'IATA_CODE': 'AIRLINE_CODE', 
+        'AIRLINE': 'AIRLINE_NAME'
+    })
+    return airport_df, airline_df
+
+
+def load_and_preprocess_data():
+    global csv_row_order
+
+    # Load main data, restricted to the columns the views declared
+    main_df = read_flight_columns(projected_columns())
+    airport_df, airline_df = read_lookup_tables()
+
+    # Add a date column for filtering. The stable sort order is kept so that columns
+    # loaded later can be lined up with the rows of main_df.
+    main_df['Date'] = pd.to_datetime(main_df[['YEAR', 'MONTH', 'DAY']])
+    csv_row_order = np.argsort(main_df['Date'].to_numpy(), kind='stable')
+    main_df = main_df.iloc[csv_row_order].reset_index(drop=True)
+
+    # Merge airlines to include full airline names
+    main_df = main_df.merge(airline_df, left_on='AIRLINE', right_on='AIRLINE_CODE', how='left')
+
+    # Merge with airport data for additional details if needed
+    origin_df = airport_df.rename(columns={
+        'IATA_CODE': 'ORIGIN_IATA_CODE',
+        'LATITUDE': 'origin_lat',
+        'LONGITUDE': 'origin_long',
+        'STATE': 'origin_state'
+    })[['ORIGIN_IATA_CODE', 'origin_lat', 'origin_long', 'origin_state']]
+
+    main_df = main_df.merge(origin_df, left_on='ORIGIN_AIRPORT', right_on='ORIGIN_IATA_CODE', how='left')
+
+    # Destination coordinates, used by the outgoing connected-airports map
+    dest_df = airport_df.rename(columns={
+        'IATA_CODE': 'DEST_IATA_CODE',
+        'LATITUDE': 'dest_lat',
+        'LONGITUDE': 'dest_long'
+    })[['DEST_IATA_CODE', 'dest_lat', 'dest_long']]
+
+    main_df = main_df.merge(dest_df, left_on='DESTINATION_AIRPORT', right_on='DEST_IATA_CODE', how='left')
+    main_df = main_df.drop(columns=['AIRLINE_CODE', 'ORIGIN_IATA_CODE', 'DEST_IATA_CODE'])
+
+    # Replace NaN with 0 or empty strings to prevent issues
+    main_df.fillna({'AIRLINE_NAME': 'Unknown Airline'}, inplace=True)
+    main_df.fillna(0, inplace=True)
+
+    return main_df, airport_df, airline_df
+
+
+def view_frame(view):
+    global main_df
+
+    # main_df is only parsed on first use when load() found the aggregates in the cache, or
+    # after load() released it. Threads that get here together wait for one parse.
+    with frame_lock:
+        if main_df is None:
+            main_df = load_and_preprocess_data()[0]
+
+        # Columns of views registered after the parse are added to a shallow copy that is
+        # then published, so callers still holding the previous frame never see it change
+        missing = [column for column in VIEW_COLUMNS[view] if column not in main_df.columns]
+        if missing:
+            extra = read_flight_columns(missing).iloc[csv_row_order].reset_index(drop=True)
+            frame = main_df.copy(deep=False)
+            for column in missing:
+                frame[column] = extra[column].fillna(0)
+            main_df = frame
+        return main_df
+
+
+# Stratified sample of main_df (one stratum per origin airport and day), drawn while
+# the day aggregates are still being built. Until then the dashboard renders wide
+# airport queries approximately from it, with error bars.
+SAMPLE_PER_STRATUM = 8
+SAMPLE_SEED = 42
+Z_95 = 1.96
+SAMPLE_MEASURES = AIRPORT_MEASURES
+SAMPLE_COLUMNS = ['ORIGIN_AIRPORT', 'Date'] + SAMPLE_MEASURES
+
+
+def build_stratified_sample(main_df):
+    strata = ['ORIGIN_AIRPORT', 'Date']
+
+    # Shuffle row positions once and keep the first SAMPLE_PER_STRATUM rows of each stratum
+    rng = np.random.default_rng(SAMPLE_SEED)
+    order = rng.permutation(len(main_df))
+    rank = main_df[strata].iloc[order].groupby(strata, sort=False).cumcount().to_numpy()
+    picked = np.sort(order[rank < SAMPLE_PER_STRATUM])
+
+    sample_df = main_df.iloc[picked][SAMPLE_COLUMNS].reset_index(drop=True)
+
+    # Population and sample size of every stratum, needed to weight the estimates
+    stratum_rows = main_df.groupby(strata).size().rename('stratum_rows')
+    sample_df = sample_df.join(stratum_rows, on=strata)
+    sample_df['stratum_sampled'] = sample_df.groupby(strata)['Date'].transform('size')
+
+    return sample_df
+
+
+def stratified_daily_means(sample_rows, columns):
+    # Per-day means for a single airport: each day is its own stratum
+    grouped = sample_rows.groupby('Date')
+    sampled = grouped['stratum_sampled'].first()
+    fpc = 1 - sampled / grouped['stratum_rows'].first()
+
+    means = grouped[columns].mean()
+    variances = grouped[columns].var(ddof=1).fillna(0)
+    std_errors = np.sqrt(variances.mul(fpc / sampled, axis=0))
+
+    return means, std_errors
+
+
+def stratified_totals(sample_rows, columns):
+    # Stratified estimator of column totals: sum over strata of N_h * mean_h
+    strata = ['ORIGIN_AIRPORT', 'Date']
+    grouped = sample_rows.groupby(strata)
+    sampled = grouped['stratum_sampled'].first()
+    population = grouped['stratum_rows'].first()
+    fpc = 1 - sampled / population
+
+    totals = grouped[columns].mean().mul(population, axis=0).sum()
+    variances = grouped[columns].var(ddof=1).fillna(0)
+    std_errors = np.sqrt(variances.mul(population ** 2 * fpc / sampled, axis=0).sum())
+
+    return totals, std_errors
+
+
+def relative_error(totals, std_errors):
+    # 95% error of the estimated slices, as a share of the whole they add up to
+    whole = totals.abs().sum()
+    if whole == 0:
+        return 0.0
+    return float(Z_95 * np.sqrt((std_errors ** 2).sum()) / whole)
+
+
+def index_airport_blocks(aggregate):
+    # Airport aggregates are sorted by airport then date, so each airport is one contiguous block
+    codes = aggregate['ORIGIN_AIRPORT'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    stops = np.r_[starts[1:], len(codes)]
+    return {codes[first]: (first, last) for first, last in zip(starts, stops)}
+
+
+# Load state. The dashboard renders from dataset metadata and shows a loading state until
+# data_ready is set; load_status says which stage the load is in.
+HOTSPOT_GRID_DEGREES = 1.0
+
+data_ready = threading.Event()
+load_lock = threading.Lock()
+frame_lock = threading.Lock()
+load_status = {'stage': 'starting', 'error': None}
+
+main_df = airport_df = airline_df = csv_row_order = None
+sample_df = day_aggregates = airport_indexes = traffic_grid = route_geometry = None
+route_months = day_row_counts = None
+rotation_by_group = rotation_by_leg = None
+metadata = None
+
+
+# Bumped whenever the tables in the aggregates cache (or the metadata) change shape, so
+# caches written by an older version are rebuilt instead of read back
+QUERY_CACHE_VERSION = 2
+
+
+def query_cache_stamp():
+    # Airport names, states and coordinates and airline names are joined into the
+    # aggregates, so a new airports.csv or airlines.csv invalidates them as well
+    return (f"v{QUERY_CACHE_VERSION}-{csv_stamp()}-{csv_stamp(AIRPORTS_CSV)}-"
+            f"{csv_stamp(AIRLINES_CSV)}")
+
+
+def metadata_path():
+    return os.path.join('.cache', f"metadata-{query_cache_stamp()}.json")
+
+
+def aggregates_cache_path():
+    return os.path.join('.cache', f"query_aggregates-{query_cache_stamp()}.pkl")
+
+
+def csv_date_bounds():
+    # flights.csv is ordered by date, so its first and last rows bound the date range
+    with open(FLIGHTS_CSV, 'rb') as csv_file:
+        header = csv_file.readline().decode().strip().split(',')
+        first = csv_file.readline().decode().split(',')
+        csv_file.seek(max(0, os.path.getsize(FLIGHTS_CSV) - 65536))
+        last = csv_file.read().decode(errors='ignore').strip().splitlines()[-1].split(',')
+
+    def row_date(row):
+        year, month, day = (int(row[header.index(part)]) for part in ['YEAR', 'MONTH', 'DAY'])
+        return f"{year:04d}-{month:02d}-{day:02d}"
+
+    return row_date(first), row_date(last)
+
+
+def dataset_metadata():
+    # Written after every full load; the first start falls back to the CSV's edges and airports.csv
+    if os.path.exists(metadata_path()):
+        with open(metadata_path()) as metadata_file:
+            return json.load(metadata_file)
+
+    start_date, end_date = csv_date_bounds()
+    airports = pd.read_csv(AIRPORTS_CSV)
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'airports_by_state': airports.groupby('STATE')['IATA_CODE'].agg(list).to_dict()
+    }
+
+
+def current_metadata():
+    # Date range and airports by state, available before (and without) a full load
+    global metadata
+    if metadata is None:
+        metadata = dataset_metadata()
+    return metadata
+
+
+def save_metadata():
+    # Origin airports that have flights, grouped by state (0 for airports missing from airports.csv)
+    airport_daily = day_aggregates['airport_daily']
+    airports = pd.Series(airport_daily['ORIGIN_AIRPORT'].unique())
+    states = airports.map(airport_df.set_index('IATA_CODE')['STATE']).fillna(0).astype(str)
+
+    metadata = {
+        'start_date': airport_daily['Date'].min().strftime('%Y-%m-%d'),
+        'end_date': airport_daily['Date'].max().strftime('%Y-%m-%d'),
+        'airports_by_state': airports.groupby(states).agg(list).to_dict()
+    }
+
+    def write(path):
+        with open(path, 'w') as metadata_file:
+            json.dump(metadata, metadata_file, default=str)
+
+    write_atomically(metadata_path(), write)
+    return metadata
+
+
+def read_cached_aggregates():
+    # The cache key covers the inputs and QUERY_CACHE_VERSION; the table check is a last
+    # guard against a cache written by code that forgot to bump the version
+    if not os.path.exists(aggregates_cache_path()):
+        return None
+    cached = pd.read_pickle(aggregates_cache_path())
+    if set(cached['day_aggregates']) != set(AGGREGATE_KEYS):
+        return None
+    return cached
+
+
+def build_aggregates(workers=1):
+    global main_df, airport_df, airline_df, sample_df
+
+    load_status['stage'] = 'parsing flights'
+    with frame_lock:
+        main_df, airport_df, airline_df = load_and_preprocess_data()
+
+    # From here on the airport charts can render approximate figures
+    load_status['stage'] = 'sampling'
+    sample_df = build_stratified_sample(main_df)
+
+    load_status['stage'] = 'aggregating'
+    aggregates = build_day_aggregates(main_df, workers)
+
+    # Rotation links (previous leg of every flight) are cached next to the parsed columns
+    load_status['stage'] = 'linking rotations'
+    previous_leg, leg_number = load_or_link_rotations(
+        view_frame('delay-propagation'), os.path.join('.cache', f"rotation_links-{csv_stamp()}.npz"))
+    by_group, by_leg = build_rotation_aggregates(main_df, previous_leg, leg_number)
+
+    cached = {'day_aggregates': aggregates, 'rotation_by_group': by_group, 'rotation_by_leg': by_leg}
+    write_atomically(aggregates_cache_path(), lambda path: pd.to_pickle(cached, path))
+    return cached
+
+
+def count_rows_per_day(table):
+    # Rows per day as prefix sums over the days, so the rows in any date range are one subtraction
+    dates = pd.date_range(table['Date'].min(), table['Date'].max(), freq='D')
+    day_codes = (table['Date'].to_numpy() - dates[0].to_datetime64()) // np.timedelta64(1, 'D')
+    return {'dates': dates, 'prefix': np.r_[0, np.cumsum(np.bincount(day_codes, minlength=len(dates)))]}
+
+
+def load(workers=1):
+    # Safe to call repeatedly and from several threads; only the first call loads
+    global main_df, sample_df, airport_df, airline_df, day_aggregates, airport_indexes, traffic_grid
+    global route_geometry, route_months, day_row_counts, rotation_by_group, rotation_by_leg, metadata
+
+    with load_lock:
+        if data_ready.is_set():
+            return
+        try:
+            load_status['stage'] = 'reading cached aggregates'
+            cached = read_cached_aggregates()
+            if cached is None:
+                cached = build_aggregates(workers)
+            else:
+                airport_df, airline_df = read_lookup_tables()
+            aggregates = cached['day_aggregates']
+
+            airport_indexes = {name: index_airport_blocks(aggregates[name])
+                               for name in ['airport_daily', 'airport_hourly']}
+
+            # Airport traffic hotspots are binned server-side; only non-empty cells reach the client
+            traffic_grid = build_traffic_grid(aggregates['route_daily'], airport_df, HOTSPOT_GRID_DEGREES)
+
+            # Great-circle arcs for every route, shared by all route-based views
+            route_geometry = build_route_geometry(aggregates['route_daily'], airport_df)
+
+            # Monthly route totals, served instead of the daily ones when the server is busy
+            route_months = build_route_months(aggregates['route_daily'], route_geometry['index'])
+
+            rotation_by_group, rotation_by_leg = cached['rotation_by_group'], cached['rotation_by_leg']
+
+            # Rows per day of every table filtered by date range, for the query cost estimates
+            day_row_counts = {name: count_rows_per_day(table) for name, table in [
+                ('route_daily', aggregates['route_daily']),
+                ('airline_daily', aggregates['airline_daily']),
+                ('AIRLINE_NAME', rotation_by_group['AIRLINE_NAME']),
+                ('ORIGIN_AIRPORT', rotation_by_group['ORIGIN_AIRPORT']),
+                ('rotation_by_leg', rotation_by_leg)
+            ]}
+
+            day_aggregates = aggregates
+
+            # Every query reads the aggregates from here on, so a cold start releases the flight
+            # rows and the sample (a warm start never loads them); view_frame re-parses on demand
+            with frame_lock:
+                main_df = None
+            sample_df = None
+
+            metadata = save_metadata()
+            load_status['stage'] = 'ready'
+            data_ready.set()
+        except Exception as error:
+            load_status['stage'] = 'failed'
+            load_status['error'] = repr(error)
+            raise
+
+
+# Queries over the day aggregates, shared by the dashboard, its /api endpoints and notebooks
+AIRLINE_RANKINGS = {
+    'least_delay': ('TOTAL_DELAY', True, "Top 10 Airlines with Least Delay"),
+    'highest_delay': ('TOTAL_DELAY', False, "Top 10 Airlines with Highest Delay"),
+    'most_cancelled': ('CANCELLED', False, "Top 10 Airlines with Most Cancelled Flights"),
+    'most_diverted': ('DIVERTED', False, "Top 10 Airlines with Most Diverted Flights")
+}
+
+
+def airports_in_state(state):
+    return current_metadata()['airports_by_state'].get(state, [])
+
+
+def airport_location(airport):
+    return airport_df.loc[airport_df['IATA_CODE'] == airport, ['IATA_CODE', 'LATITUDE', 'LONGITUDE']]
+
+
+def airport_bounds(name, airport, start_date, end_date):
+    # Row range of an airport aggregate for one airport and date range, found by binary search
+    first, last = airport_indexes[name].get(airport, (0, 0))
+    dates = day_aggregates[name]['Date'].to_numpy()[first:last]
+    start = first + np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+    stop = first + np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+    return start, stop
+
+
+def airport_daily_stats(airport, start_date, end_date):
+    start, stop = airport_bounds('airport_daily', airport, start_date, end_date)
+    return day_aggregates['airport_daily'].iloc[start:stop]
+
+
+def hourly_delay_profile(airport, start_date, end_date):
+    # Weekday x scheduled-hour means and rates, summed from the airport/day/hour cube
+    start, stop = airport_bounds('airport_hourly', airport, start_date, end_date)
+    cube_rows = day_aggregates['airport_hourly'].iloc[start:stop]
+
+    profile = (cube_rows.assign(weekday=cube_rows['Date'].dt.dayofweek)
+               .groupby(['weekday', 'HOUR'])[HOURLY_MEASURES].sum()
+               .reindex(pd.MultiIndex.from_product([range(7), range(24)], names=['weekday', 'HOUR']),
+                        fill_value=0))
+    departed = profile['departed'].where(profile['departed'] > 0)
+    flights = profile['flights'].where(profile['flights'] > 0)
+
+    return pd.DataFrame({
+        'avg_departure_delay': profile['DEPARTURE_DELAY'] / departed,
+        'avg_taxi_out': profile['TAXI_OUT'] / departed,
+        'cancellation_rate': profile['CANCELLED'] / flights
+    }).reset_index()
+
+
+def filter_dates(df, start_date, end_date):
+    return df[(df['Date'] >= start_date) & (df['Date'] <= end_date)]
+
+
+def top_connected_airports(airport, start_date, end_date, direction, n=7, coarse=False):
+    if coarse:
+        route_daily = route_counts(start_date, end_date, coarse=True).rename(columns={'flight_count': 'flights'})
+    else:
+        route_daily = filter_dates(day_aggregates['route_daily'], start_date, end_date)
+    if direction == 'incoming':
+        connected_df = route_daily[route_daily['DESTINATION_AIRPORT'] == airport]
+        airport_column = 'ORIGIN_AIRPORT'
+    else:
+        connected_df = route_daily[route_daily['ORIGIN_AIRPORT'] == airport]
+        airport_column = 'DESTINATION_AIRPORT'
+
+    top_df = connected_df.groupby(airport_column)['flights'].sum().nlargest(n)
+    top_df = top_df.rename_axis('AIRPORT').reset_index()
+    return top_df.merge(airport_df[['IATA_CODE', 'LATITUDE', 'LONGITUDE']],
+                        left_on='AIRPORT', right_on='IATA_CODE', how='left').drop(columns='IATA_CODE')
+
+
+def covering_months(start_date, end_date):
+    # Rows of the monthly route level for the whole calendar months that cover the range
+    months = route_months['months']
+    first = months.searchsorted(pd.Timestamp(start_date).replace(day=1), side='left')
+    stop = months.searchsorted(pd.Timestamp(end_date), side='right')
+    return first, stop
+
+
+def route_counts(start_date, end_date, coarse=False):
+    if coarse:
+        # Whole calendar months covering the range, one subtraction over the routes
+        first, stop = covering_months(start_date, end_date)
+        flights = route_months['prefix'][max(stop, first)] - route_months['prefix'][first]
+        nonempty = flights > 0
+        return (route_months['routes'][nonempty].to_frame(index=False)
+                .assign(flight_count=flights[nonempty]))
+
+    route_daily = filter_dates(day_aggregates['route_daily'], start_date, end_date)
+    return (route_daily.groupby(['ORIGIN_AIRPORT', 'DESTINATION_AIRPORT'])['flights'].sum()
+            .reset_index(name='flight_count'))
+
+
+def airline_rankings(category, start_date, end_date, n=10):
+    column, ascending, _ = AIRLINE_RANKINGS[category]
+    airline_daily = filter_dates(day_aggregates['airline_daily'], start_date, end_date)
+    agg_df = airline_daily.groupby('AIRLINE_NAME')[column].sum().reset_index()
+    return agg_df.sort_values(column, ascending=ascending).head(n).reset_index(drop=True)
+
+
+def hotspot_bins(start_date, end_date):
+    # Flights per grid cell over the range, from two rows of the per-day prefix sums
+    dates = traffic_grid['dates']
+    first = dates.searchsorted(pd.Timestamp(start_date), side='left')
+    stop = dates.searchsorted(pd.Timestamp(end_date), side='right')
+    flights = traffic_grid['prefix'][stop] - traffic_grid['prefix'][first]
+
+    nonempty = flights > 0
+    bins = traffic_grid['cells'][nonempty].reset_index(drop=True)
+    bins['flights'] = flights[nonempty]
+    return bins
+
+
+def delay_propagation(group, start_date, end_date, n=15):
+    # group: 'AIRLINE_NAME' or 'ORIGIN_AIRPORT' (hub where the aircraft turned around)
+    rows = filter_dates(rotation_by_group[group], start_date, end_date)
+    totals = rows.groupby(group)[['linked', 'inbound_delay', 'late_aircraft_delay']].sum()
+    totals = totals[totals['inbound_delay'] > 0].nlargest(n, 'linked')
+
+    # Share of the inbound legs' arrival delay that came back as late-aircraft delay
+    totals['propagation_ratio'] = totals['late_aircraft_delay'] / totals['inbound_delay']
+    return totals.sort_values('propagation_ratio', ascending=False).reset_index()
+
+
+def delay_by_leg(start_date, end_date):
+    rows = filter_dates(rotation_by_leg, start_date, end_date)
+    legs = rows.groupby(['AIRLINE_NAME', 'leg'])[['sum', 'count']].sum()
+    legs['avg_departure_delay'] = legs['sum'] / legs['count']
+    legs = legs.reset_index()
+    # Legs past MAX_LEG are counted in the last bucket, so it is labelled as open-ended
+    legs['leg_label'] = legs['leg'].astype(str).where(legs['leg'] < MAX_LEG, f"{MAX_LEG}+")
+    return legs
+
+
+# Query cost estimates, made before a query runs: rows it scans plus points it sends.
+# Queries for a single airport are bounded by that airport's days and are not estimated.
+def rows_in_range(name, start_date, end_date):
+    dates, prefix = day_row_counts[name]['dates'], day_row_counts[name]['prefix']
+    first = dates.searchsorted(pd.Timestamp(start_date), side='left')
+    stop = dates.searchsorted(pd.Timestamp(end_date), side='right')
+    return int(prefix[max(stop, first)] - prefix[first])
+
+
+def query_cost(view, start_date, end_date, group=None, map_scale=1):
+    if view == 'popular-routes':
+        rows = rows_in_range('route_daily', start_date, end_date)
+        # Each route sends its arc, a gap, a hover point and two airport markers
+        routes = min(rows, len(route_geometry['index']))
+        return rows + routes * (arc_points_for_scale(map_scale, routes) + 4)
+    if view in ('connected-airports', 'route-counts'):
+        return rows_in_range('route_daily', start_date, end_date)
+    if view in ('passenger-bar-chart', 'airline-rankings'):
+        return rows_in_range('airline_daily', start_date, end_date)
+    if view == 'delay-propagation':
+        return rows_in_range(group, start_date, end_date) + rows_in_range('rotation_by_leg', start_date, end_date)
+    raise ValueError(f"No cost estimate for view {view!r}")
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache_files import write_atomically
+
+# Aircraft rotations: every flight is linked to the previous leg flown the same day by
+# the same tail number, so late-aircraft delay can be traced back to the inbound leg.
+# Linking is a single lexsort plus a shifted comparison over compact integer arrays.
+
+ROTATION_COLUMNS = ['TAIL_NUMBER', 'SCHEDULED_DEPARTURE', 'DEPARTURE_DELAY',
+                    'ARRIVAL_DELAY', 'LATE_AIRCRAFT_DELAY', 'CANCELLED']
+MAX_LEG = 8
+
+
+def link_rotations(tail_codes, day_codes, scheduled_departure):
+    # Returns, per flight, the row of its previous leg (-1 for the first leg of the day
+    # or flights without a tail number) and its leg number within the day.
+    # Flights with a negative tail code are left unlinked.
+    n = len(tail_codes)
+    flown = np.flatnonzero(tail_codes >= 0)
+    order = flown[np.lexsort((scheduled_departure[flown], day_codes[flown], tail_codes[flown]))]
+
+    same_rotation = ((tail_codes[order][1:] == tail_codes[order][:-1]) &
+                     (day_codes[order][1:] == day_codes[order][:-1]))
+
+    previous_leg = np.full(n, -1, dtype=np.int64)
+    previous_leg[order[1:][same_rotation]] = order[:-1][same_rotation]
+
+    # Leg number: distance from the start of the rotation in sorted order
+    positions = np.arange(len(order))
+    starts = np.where(np.r_[True, ~same_rotation], positions, 0)
+    leg_number = np.zeros(n, dtype=np.int16)
+    leg_number[order] = positions - np.maximum.accumulate(starts) + 1
+
+    return previous_leg, leg_number
+
+
+def rotation_arrays(frame):
+    tails = frame['TAIL_NUMBER']
+    tail_codes, uniques = pd.factorize(tails)
+
+    # fillna(0) leaves non-string placeholders for missing tail numbers; cancelled flights never flew
+    missing = [code for code, tail in enumerate(uniques) if not isinstance(tail, str)]
+    tail_codes = np.where(np.isin(tail_codes, missing) | (frame['CANCELLED'].to_numpy() == 1),
+                          -1, tail_codes)
+    day_codes = frame['Date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+    return link_rotations(tail_codes, day_codes, frame['SCHEDULED_DEPARTURE'].to_numpy())
+
+
+def load_or_link_rotations(frame, cache_path):
+    # The link arrays are reused across restarts as long as main_df has the same rows
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if len(cached['previous_leg']) == len(frame):
+            return cached['previous_leg'], cached['leg_number']
+
+    previous_leg, leg_number = rotation_arrays(frame)
+    write_atomically(cache_path, lambda path: np.savez(path, previous_leg=previous_leg, leg_number=leg_number))
+    return previous_leg, leg_number
+
+
+def build_rotation_aggregates(frame, previous_leg, leg_number):
+    linked = previous_leg >= 0
+    inbound_delay = np.where(linked, frame['ARRIVAL_DELAY'].to_numpy()[previous_leg], 0)
+
+    flights = pd.DataFrame({
+        'Date': frame['Date'],
+        'AIRLINE_NAME': frame['AIRLINE_NAME'],
+        'ORIGIN_AIRPORT': frame['ORIGIN_AIRPORT'],
+        'leg': np.minimum(leg_number, MAX_LEG),
+        'linked': linked.astype(np.int32),
+        # Only late inbound legs can push delay onto the next one
+        'inbound_delay': np.where(linked, np.maximum(inbound_delay, 0), 0),
+        'late_aircraft_delay': np.where(linked, frame['LATE_AIRCRAFT_DELAY'].to_numpy(), 0),
+        'DEPARTURE_DELAY': frame['DEPARTURE_DELAY']
+    })
+    flown = flights[flights['leg'] > 0]
+    measures = ['linked', 'inbound_delay', 'late_aircraft_delay']
+
+    # Propagation per airline and per hub (the airport where the aircraft turned around)
+    by_group = {
+        group: flown.groupby([group, 'Date'])[measures].sum().reset_index()
+        for group in ['AIRLINE_NAME', 'ORIGIN_AIRPORT']
+    }
+
+    # Departure delay by position in the day's rotation
+    by_leg = (flown.groupby(['AIRLINE_NAME', 'leg', 'Date'])['DEPARTURE_DELAY']
+              .agg(['sum', 'count']).reset_index())
+
+    return by_group, by_leg
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# Great-circle arcs for every airport pair, computed once with vectorized spherical
+# interpolation and kept in a single (routes x points x 2) float32 array. A route id is
+# the row of its arc in that array. Views pick a coarser subset of each arc's points
+# when zoomed out and cap the total number of points they send.
+
+ARC_POINTS = 33
+
+# (minimum geo projection scale, points per arc); zooming in past a scale uses more points
+ARC_POINTS_BY_SCALE = [(0, 9), (2, 17), (4, ARC_POINTS)]
+MAX_ROUTE_POINTS = 60000
+
+
+def unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def great_circle_arcs(lat1, lon1, lat2, lon2, n_points=ARC_POINTS):
+    start, end = unit_vectors(lat1, lon1), unit_vectors(lat2, lon2)
+    omega = np.arccos(np.clip(np.sum(start * end, axis=-1), -1, 1))[:, None]
+    t = np.linspace(0, 1, n_points)[None, :]
+
+    # Spherical interpolation; coincident endpoints fall back to linear weights
+    sin_omega = np.sin(omega)
+    short = sin_omega < 1e-9
+    safe = np.where(short, 1, sin_omega)
+    weight_start = np.where(short, 1 - t, np.sin((1 - t) * omega) / safe)
+    weight_end = np.where(short, t, np.sin(t * omega) / safe)
+    points = weight_start[..., None] * start[:, None, :] + weight_end[..., None] * end[:, None, :]
+
+    lat = np.degrees(np.arcsin(points[..., 2] / np.linalg.norm(points, axis=-1)))
+    # Unwrapped so arcs crossing the antimeridian stay continuous
+    lon = np.degrees(np.unwrap(np.arctan2(points[..., 1], points[..., 0]), axis=1))
+    return np.stack([lat, lon], axis=-1).astype(np.float32)
+
+
+def build_route_geometry(route_daily, airport_df):
+    routes = route_daily[['ORIGIN_AIRPORT', 'DESTINATION_AIRPORT']].drop_duplicates().reset_index(drop=True)
+    coords = airport_df.set_index('IATA_CODE')[['LATITUDE', 'LONGITUDE']]
+    origin = coords.reindex(routes['ORIGIN_AIRPORT']).to_numpy()
+    dest = coords.reindex(routes['DESTINATION_AIRPORT']).to_numpy()
+
+    # Routes touching an airport without coordinates get all-NaN arcs, which plot as gaps
+    return {
+        'index': pd.MultiIndex.from_frame(routes),
+        'arcs': great_circle_arcs(origin[:, 0], origin[:, 1], dest[:, 0], dest[:, 1])
+    }
+
+
+def arc_points_for_scale(scale, n_routes):
+    points = ARC_POINTS_BY_SCALE[0][1]
+    for min_scale, level_points in ARC_POINTS_BY_SCALE:
+        if scale >= min_scale:
+            points = level_points
+    # Keep the total point count bounded however many routes are drawn
+    return int(max(2, min(points, MAX_ROUTE_POINTS // max(n_routes, 1))))
+
+
+def route_polylines(geometry, origins, destinations, scale=1):
+    # Flattened lat/lon arrays for the given routes, one NaN after each arc so they plot as
+    # separate lines, plus the number of points used per arc
+    route_ids = geometry['index'].get_indexer(pd.MultiIndex.from_arrays([origins, destinations]))
+    points = arc_points_for_scale(scale, len(route_ids))
+    keep = np.unique(np.linspace(0, ARC_POINTS - 1, points).round().astype(int))
+
+    arcs = geometry['arcs'][route_ids][:, keep, :]
+    arcs[route_ids < 0] = np.nan
+    gaps = np.full((len(route_ids), 1), np.nan, dtype=np.float32)
+
+    lat = np.hstack([arcs[..., 0], gaps]).ravel()
+    lon = np.hstack([arcs[..., 1], gaps]).ravel()
+    return lat, lon, len(keep)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+import aggregates
+from aggregates import AIRPORT_MEASURES, build_day_aggregates, day_ranges
+
+
+def synthetic_flights(rows=20000, days=45, seed=7):
+    # A date-sorted frame with the columns build_day_aggregates reads
+    rng = np.random.default_rng(seed)
+    airports = np.array(['ATL', 'DFW', 'DEN', 'ORD', 'LAX', 'SFO'], dtype=object)
+    frame = pd.DataFrame({
+        'Date': pd.Timestamp('2015-01-01') + pd.to_timedelta(np.sort(rng.integers(0, days, rows)), unit='D'),
+        'ORIGIN_AIRPORT': rng.choice(airports, rows),
+        'DESTINATION_AIRPORT': rng.choice(airports, rows),
+        'AIRLINE_NAME': rng.choice(np.array(['AA Airlines', 'DL Airlines', 'UA Airlines'], dtype=object), rows),
+        'SCHEDULED_DEPARTURE': rng.integers(0, 2400, rows),
+        'CANCELLED': (rng.random(rows) < 0.05).astype(np.int64),
+        'DIVERTED': (rng.random(rows) < 0.01).astype(np.int64)
+    })
+    for column in AIRPORT_MEASURES:
+        frame[column] = rng.integers(-10, 120, rows).astype(np.float64)
+    return frame
+
+
+def test_day_ranges_cover_all_rows_and_end_on_day_boundaries():
+    days = synthetic_flights()['Date'].to_numpy().astype('datetime64[D]').astype(np.int32)
+    ranges = day_ranges(days, 16)
+
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(days)
+    assert all(stop == first for (_, stop), (first, _) in zip(ranges[:-1], ranges[1:]))
+    assert all(days[first - 1] != days[first] for first, _ in ranges[1:])
+
+
+def test_day_aggregates_do_not_depend_on_worker_count(monkeypatch):
+    # Small enough ranges that every worker count splits the frame differently
+    monkeypatch.setattr(aggregates, 'MIN_RANGE_ROWS', 1000)
+    main_df = synthetic_flights()
+    expected = build_day_aggregates(main_df, workers=1)
+
+    for workers in [2, 4]:
+        result = build_day_aggregates(main_df, workers=workers)
+        for name, table in expected.items():
+            pd.testing.assert_frame_equal(result[name], table)